@@ -1,13 +1,23 @@
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BufferedInputFile, FSInputFile, ErrorEvent
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-import json
+from aiogram.filters import ExceptionTypeFilter, StateFilter
+import asyncio
+import importlib.util
 import os
+import re
+import shutil
+import tempfile
+import time
 
-ADMIN_ID = 7028215322  # замените на ваш Telegram user_id
+from survey_config import QUESTIONS_FILE, dump_questions, get_survey, survey_cache, thaw, validate_data, write_atomic
+from profiler import profile_capture
+from lead_log import export_leads, lead_log
+from survey_io import load_document, survey_to_xlsx
+from bans import banned_users
 
-QUESTIONS_FILE = "questions_data.json"
+ADMIN_ID = 7028215322  # замените на ваш Telegram user_id
 
 admin_router = Router()
 
@@ -21,27 +31,46 @@ class AdminState(StatesGroup):
     edit_choices_input = State()
     edit_final_phrase = State()
     edit_final_phrase_input = State()
+    import_survey = State()
+    ban_input = State()
+    unban_input = State()
+
+class SurveyUnavailable(Exception):
+    """Рабочего конфига опроса нет (файл отсутствует или повреждён) — править нечего."""
 
 def load_questions():
-    if not os.path.exists(QUESTIONS_FILE):
-        return {}
-    with open(QUESTIONS_FILE, encoding="utf-8") as f:
-        return json.load(f)
+    survey = get_survey()
+    if survey_cache.placeholder:
+        # Правка пустой заглушки перезаписала бы настоящий конфиг
+        raise SurveyUnavailable
+    # Изменяемая копия снимка из общего кэша
+    return thaw(survey.data)
 
-def save_questions(data):
+# Правки нескольких сообщений админа не должны перетирать друг друга
+_save_lock = asyncio.Lock()
+
+async def save_questions(data):
     try:
-        with open(QUESTIONS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # Проверяем что изменения записались
-        with open(QUESTIONS_FILE, encoding="utf-8") as f:
-            check = json.load(f)
-        if check == data:
-            return True
-        else:
-            return False
+        # Неполный или некомпилируемый конфиг (в т.ч. без вопросов) даже не пишем на диск
+        validate_data(data)
+        payload = dump_questions(data)
+        async with _save_lock:
+            # Запись и fsync — в потоке, чтобы не держать event loop
+            if not await asyncio.to_thread(write_atomic, QUESTIONS_FILE, payload):
+                return False
+            survey_cache.publish(data)
+        return True
     except Exception as ex:
+        print("Error saving questions:", ex)
         return False
 
+@admin_router.error(ExceptionTypeFilter(SurveyUnavailable))
+async def admin_survey_unavailable(event: ErrorEvent):
+    message = event.update.message
+    if message is not None:
+        await message.answer(f"Не удалось загрузить {QUESTIONS_FILE} (файла нет или он повреждён). "
+                             "Исправьте файл или загрузите опрос через «Импорт опроса».")
+
 @admin_router.message(F.text == "/admin")
 async def admin_start(message: Message, state: FSMContext):
     if message.from_user.id != ADMIN_ID:
@@ -52,6 +81,10 @@ async def admin_start(message: Message, state: FSMContext):
             [KeyboardButton(text="Изменить вопросы")],
             [KeyboardButton(text="Изменить ссылку менеджера")],
             [KeyboardButton(text="Изменить финальную фразу")],
+            [KeyboardButton(text="Экспорт опроса"), KeyboardButton(text="Импорт опроса")],
+            [KeyboardButton(text="Выгрузить лиды")],
+            [KeyboardButton(text="Забанить"), KeyboardButton(text="Разбанить"), KeyboardButton(text="Список банов")],
+            [KeyboardButton(text="Профилирование: стоп" if profile_capture.active else "Профилирование: старт")],
             [KeyboardButton(text="Выйти")]
         ], resize_keyboard=True)
     await message.answer("Админ-панель:", reply_markup=kb)
@@ -84,12 +117,159 @@ async def admin_edit_final_phrase(message: Message, state: FSMContext):
 async def admin_save_final_phrase(message: Message, state: FSMContext):
     data = load_questions()
     data["final_phrase"] = message.text.strip()
-    if save_questions(data):
+    if await save_questions(data):
         await message.answer("Успешно изменено.")
     else:
         await message.answer("Ошибка.")
     await admin_start(message, state)
 
+@admin_router.message(AdminState.main, F.text == "Профилирование: старт")
+async def admin_profile_start(message: Message, state: FSMContext):
+    if profile_capture.start():
+        await message.answer(f"Профилирование запущено (не дольше {profile_capture.max_seconds:.0f} с).")
+    else:
+        await message.answer("Профилирование уже идёт.")
+    await admin_start(message, state)
+
+@admin_router.message(AdminState.main, F.text == "Профилирование: стоп")
+async def admin_profile_stop(message: Message, state: FSMContext):
+    # Окно могло закрыться по таймауту — тогда отдаём последний отчёт
+    report = profile_capture.stop() or profile_capture.last_report
+    if report is None:
+        await message.answer("Профилирование не запущено.")
+    else:
+        name, text = report
+        await message.answer_document(BufferedInputFile(text.encode("utf-8"), filename=name))
+    await admin_start(message, state)
+
+# Больше опрос весить не может, остальное — явно не тот файл
+SURVEY_DOCUMENT_MAX_SIZE = 5 * 1024 * 1024
+
+@admin_router.message(AdminState.main, F.text == "Экспорт опроса")
+async def admin_export_survey(message: Message, state: FSMContext):
+    data = load_questions()
+    if importlib.util.find_spec("openpyxl"):
+        content = await asyncio.to_thread(survey_to_xlsx, data)
+        name = "survey.xlsx"
+    else:
+        content = dump_questions(data)
+        name = QUESTIONS_FILE
+    await message.answer_document(BufferedInputFile(content, filename=name),
+                                  caption=f"Версия опроса: {get_survey().digest}")
+
+@admin_router.message(AdminState.main, F.text == "Импорт опроса")
+async def admin_ask_survey_document(message: Message, state: FSMContext):
+    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="Назад")]], resize_keyboard=True)
+    await message.answer(
+        "Пришлите файл опроса (.xlsx из «Экспорт опроса» или questions_data.json). "
+        "Опрос заменится целиком.", reply_markup=kb)
+    await state.set_state(AdminState.import_survey)
+
+@admin_router.message(AdminState.import_survey, F.document)
+async def admin_import_survey(message: Message, state: FSMContext):
+    document = message.document
+    if document.file_size and document.file_size > SURVEY_DOCUMENT_MAX_SIZE:
+        await message.answer("Файл слишком большой.")
+        return
+    try:
+        content = (await message.bot.download(document)).getvalue()
+        # Разбор XLSX и проверка всего опроса — в потоке, чтобы не держать event loop
+        data = await asyncio.to_thread(load_document, document.file_name or "", content)
+    except ValueError as ex:
+        await message.answer(f"Опрос не принят: {ex}")
+        return
+    except Exception as ex:
+        print("Error importing survey:", ex)
+        await message.answer("Ошибка.")
+        return
+    if await save_questions(data):
+        await message.answer(
+            f"Опрос обновлён: {len(data['ru'])} вопросов RU, {len(data['en'])} EN. "
+            f"Версия: {get_survey().digest}")
+        await admin_start(message, state)
+    else:
+        await message.answer("Ошибка.")
+
+@admin_router.message(AdminState.import_survey, F.text == "Назад")
+async def admin_cancel_import(message: Message, state: FSMContext):
+    await admin_start(message, state)
+
+@admin_router.message(AdminState.import_survey)
+async def admin_import_not_document(message: Message, state: FSMContext):
+    await message.answer("Нужен файл .xlsx или .json, либо «Назад».")
+
+# Список id для массового бана: текстом или .txt/.csv файлом
+BAN_DOCUMENT_MAX_SIZE = 20 * 1024 * 1024
+
+async def read_user_ids(message):
+    if message.document:
+        if message.document.file_size and message.document.file_size > BAN_DOCUMENT_MAX_SIZE:
+            return None
+        text = (await message.bot.download(message.document)).getvalue().decode("utf-8", "replace")
+    else:
+        text = message.text or ""
+    return [int(x) for x in re.findall(r"\d+", text)]
+
+@admin_router.message(AdminState.main, F.text.in_({"Забанить", "Разбанить"}))
+async def admin_ask_ban_ids(message: Message, state: FSMContext):
+    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="Назад")]], resize_keyboard=True)
+    await message.answer("Пришлите Telegram ID через пробел, запятую или с новой строки (можно .txt файлом):",
+                         reply_markup=kb)
+    await state.set_state(AdminState.ban_input if message.text == "Забанить" else AdminState.unban_input)
+
+@admin_router.message(StateFilter(AdminState.ban_input, AdminState.unban_input), F.text == "Назад")
+async def admin_cancel_ban(message: Message, state: FSMContext):
+    await admin_start(message, state)
+
+@admin_router.message(StateFilter(AdminState.ban_input, AdminState.unban_input))
+async def admin_save_bans(message: Message, state: FSMContext):
+    ids = await read_user_ids(message)
+    if not ids:
+        await message.answer("Не нашёл ни одного ID." if ids is not None else "Файл слишком большой.")
+        return
+    if await state.get_state() == AdminState.ban_input.state:
+        ids = {uid for uid in ids if uid != ADMIN_ID}
+        changed = banned_users.update(ids)
+        await message.answer(f"Забанено: {changed} (уже были в бане: {len(ids) - changed}).")
+    else:
+        changed = banned_users.remove(ids)
+        await message.answer(f"Разбанено: {changed}.")
+    await admin_start(message, state)
+
+@admin_router.message(AdminState.main, F.text == "Список банов")
+async def admin_list_bans(message: Message, state: FSMContext):
+    # В памяти воркера — только баны его пользователей, полный список берём из хранилища
+    ids = await banned_users.all_ids()
+    if not ids:
+        await message.answer("Банов нет.")
+        return
+    content = "\n".join(map(str, ids)).encode()
+    await message.answer_document(BufferedInputFile(content, filename="bans.txt"),
+                                  caption=f"Забанено: {len(ids)}")
+
+@admin_router.message(AdminState.main, F.text == "Выгрузить лиды")
+async def admin_export_leads(message: Message, state: FSMContext):
+    if not lead_log.enabled:
+        await message.answer("Журнал лидов отключён (LEAD_LOG_PATH).")
+        return
+    # Дописываем буфер, чтобы в выгрузку попали самые свежие лиды
+    await lead_log.flush()
+    if not os.path.exists(lead_log.path):
+        await message.answer("Лидов пока нет.")
+        return
+    ext = "xlsx" if importlib.util.find_spec("openpyxl") else "csv"
+    tmp_dir = tempfile.mkdtemp(prefix="leads-")
+    try:
+        path = os.path.join(tmp_dir, time.strftime(f"leads-%Y%m%d-%H%M%S.{ext}"))
+        # Журнал читается построчно в отдельном потоке — event loop не блокируется
+        count = await asyncio.to_thread(export_leads, path, get_survey(), lead_log.path)
+        await message.answer_document(FSInputFile(path), caption=f"Лидов: {count}")
+    except Exception as ex:
+        print("Error exporting leads:", ex)
+        await message.answer("Ошибка выгрузки.")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 @admin_router.message(AdminState.main, F.text == "Выйти")
 async def admin_exit(message: Message, state: FSMContext):
     await state.clear()
@@ -99,7 +279,7 @@ async def admin_exit(message: Message, state: FSMContext):
 async def admin_save_link(message: Message, state: FSMContext):
     data = load_questions()
     data["contact_link"] = message.text.strip()
-    if save_questions(data):
+    if await save_questions(data):
         await message.answer("Успешно изменено.")
     else:
         await message.answer("Ошибка.")
@@ -174,7 +354,7 @@ async def admin_save_new_text(message: Message, state: FSMContext):
     lang = sd.get("lang")
     qnum = sd.get("qnum")
     data[lang][qnum]["question"] = message.text.strip()
-    if save_questions(data):
+    if await save_questions(data):
         await message.answer("Успешно изменено.")
     else:
         await message.answer("Ошибка.")
@@ -188,7 +368,7 @@ async def admin_save_new_choices(message: Message, state: FSMContext):
     qnum = sd.get("qnum")
     new_choices = [c.strip() for c in message.text.split(",") if c.strip()]
     data[lang][qnum]["choices"] = new_choices
-    if save_questions(data):
+    if await save_questions(data):
         await message.answer("Успешно изменено.")
     else:
         await message.answer("Ошибка.")
@@ -0,0 +1,100 @@
+"""Микробенчмарк движка опроса: синтетические сессии прогоняются через
+survey_engine.step без aiogram, сети и хранилища.
+
+Сценарии те же, что у нагрузочного теста (bench/loadtest.py). С --processes
+сессии делятся между процессами — так же можно проигрывать записанный трафик.
+
+    python bench/engine_bench.py --users 100000
+    python bench/engine_bench.py --users 400000 --processes 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import survey_engine  # noqa: E402
+from bench.loadtest import build_scenario  # noqa: E402
+from survey_config import QUESTIONS_FILE, SurveyCache  # noqa: E402
+
+
+def load_survey():
+    return SurveyCache(os.path.join(ROOT, QUESTIONS_FILE)).get()
+
+
+def make_scenarios(args, count, seed):
+    survey = load_survey()
+    rng = random.Random(seed)
+    # Первый шаг сценария — /start, его делает survey_engine.start()
+    return [[text for text, _ in build_scenario(survey, random.Random(rng.random()), args)[0][1:]]
+            for _ in range(count)]
+
+
+def run_chunk(args, count, seed):
+    """Прогоняет count сессий. Возвращает (шагов, действий, завершено, забанено, секунд)."""
+    survey = load_survey()
+    scenarios = make_scenarios(args, count, seed)
+    steps = actions = completed = banned = 0
+    started = time.perf_counter()
+    for texts in scenarios:
+        progress, out = survey_engine.start()
+        actions += len(out)
+        for text in texts:
+            progress, out = survey_engine.step(survey, progress, text)
+            steps += 1
+            actions += len(out)
+        if progress.stage == survey_engine.DONE:
+            completed += 1
+        elif progress.stage == survey_engine.BANNED:
+            banned += 1
+    return steps, actions, completed, banned, time.perf_counter() - started
+
+
+def main(args):
+    if args.processes > 1:
+        chunk = -(-args.users // args.processes)
+        started = time.perf_counter()
+        with ProcessPoolExecutor(args.processes) as pool:
+            parts = list(pool.map(
+                run_chunk, [args] * args.processes,
+                [min(chunk, args.users - i * chunk) for i in range(args.processes)],
+                [args.seed + i for i in range(args.processes)]))
+        elapsed = time.perf_counter() - started
+    else:
+        parts = [run_chunk(args, args.users, args.seed)]
+        elapsed = parts[0][4]
+    steps = sum(p[0] for p in parts)
+    report = {
+        "users": args.users,
+        "processes": max(1, args.processes),
+        "steps": steps,
+        "actions": sum(p[1] for p in parts),
+        "surveys_completed": sum(p[2] for p in parts),
+        "users_banned": sum(p[3] for p in parts),
+        # Время самих шагов, без генерации сценариев и старта процессов
+        "engine_s": round(max(p[4] for p in parts), 3),
+        "wall_s": round(elapsed, 3),
+        "steps_per_s": round(steps / max(p[4] for p in parts), 1),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=100000)
+    p.add_argument("--processes", type=int, default=1)
+    p.add_argument("--under18", type=float, default=0.05, help="доля пользователей младше 18")
+    p.add_argument("--other", type=float, default=0.3, help="доля выбравших «Другое»")
+    p.add_argument("--invalid", type=float, default=0.1, help="доля ошибочных ответов")
+    p.add_argument("--seed", type=int, default=1)
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,275 @@
+"""Нагрузочный тест: синтетические пользователи проходят опрос через POST /webhook.
+
+Бот запускается отдельным процессом (bot.py) и ходит в заглушку Bot API
+(bench/stub_api.py). Каждый пользователь проходит весь сценарий: выбор языка,
+СТАРТ, все вопросы с ветками depends_on, «Другое» со своим вариантом,
+ошибки валидации и блокировку младше 18. Задержка шага — от POST апдейта до
+ответа бота пользователю в заглушке.
+
+    python bench/loadtest.py --users 2000
+    python bench/loadtest.py --users 5000 --workers 4 --storage sqlite
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.stub_api import StubBotAPI  # noqa: E402
+from survey_config import QUESTIONS_FILE, SurveyCache  # noqa: E402
+
+LANG_BUTTONS = {"ru": "Русский", "en": "English"}
+START_BUTTONS = {"ru": "СТАРТ", "en": "START"}
+OTHER_WORDS = {"ru": "Другое", "en": "Other"}
+FREE_TEXT = {
+    "ru": ["Иван Петров", "Казахстан", "Спот и фьючерсы", "Увидел рекламу у блогера",
+           "Хочу стабильный доход, готов начать сразу"],
+    "en": ["John Smith", "Germany", "Spot trading and DeFi", "Saw an ad from a blogger",
+           "Stable income, ready to start right away"],
+}
+INVALID_TEXT = "12345 !!!"
+
+
+def build_scenario(survey, rng, args):
+    """Список шагов (текст, сколько sendMessage бот пришлёт в ответ)."""
+    lang = rng.choice(("ru", "en"))
+    steps = [("/start", 1), (LANG_BUTTONS[lang], 2), (START_BUTTONS[lang], 1)]
+    banned = rng.random() < args.under18
+    questions = survey.questions(lang)
+    answers = {}
+    idx = 0
+    while idx < len(questions):
+        q = questions[idx]
+        kind = q.spec["type"]
+        if kind == "age_min":
+            if rng.random() < args.invalid:
+                steps.append(("abc", 1))
+            if banned:
+                steps.append((str(rng.randint(12, int(q.spec.get("min", 18)) - 1)), 1))
+                return steps, True
+            answer = str(rng.randint(int(q.spec.get("min", 18)), 60))
+        elif kind == "other_free_text":
+            if rng.random() < args.other:
+                steps.append((OTHER_WORDS[lang], 1))
+                answer = rng.choice(FREE_TEXT[lang])
+            else:
+                other = {v.lower() for v in q.spec.get("other", ("другое", "other"))}
+                answer = rng.choice([c for c in q.choices if c.strip().lower() not in other])
+        elif kind == "choice":
+            answer = rng.choice(q.choices)
+        else:
+            if rng.random() < args.invalid:
+                steps.append((INVALID_TEXT, 1))
+            answer = rng.choice(FREE_TEXT[lang])
+        steps.append((answer, 1))
+        answers[f"q{idx+1}"] = answer
+        idx = survey.next_index(lang, idx, answer, answers)
+    return steps, False
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def rss_kb(pid):
+    """RSS процесса и всех его потомков (режим scale-out), в килобайтах."""
+    total = 0
+    pids = [pid]
+    while pids:
+        p = pids.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return total
+
+
+async def wait_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Бот не начал слушать порт {port} за {timeout} с")
+
+
+def bot_env(args, workdir):
+    env = dict(os.environ)
+    env.update({
+        "API_TOKEN": "123456:BENCH",
+        "WEBHOOK_URL": "http://127.0.0.1",
+        "BOT_API_URL": f"http://127.0.0.1:{args.api_port}",
+        "PORT": str(args.port),
+        "STORAGE_BACKEND": args.storage,
+        "STORAGE_PATH": os.path.join(workdir, "bot_state.db"),
+        "MEDIA_CACHE_FILE": os.path.join(workdir, "media_file_ids.json"),
+        # Синтетические лиды не должны попасть в настоящий журнал и его выгрузку
+        "LEAD_LOG_PATH": os.path.join(workdir, "leads.jsonl"),
+        "STARTUP_SNAPSHOT": os.path.join(workdir, "startup_snapshot.bin"),
+        "SCALE_WORKERS": str(args.workers),
+        "WORKER_BASE_PORT": str(args.port + 100),
+    })
+    if not args.real_limits:
+        # Меряем сам бот, а не лимиты Telegram
+        env.update({"API_CHAT_RATE": "100000", "API_CHAT_BURST": "1000",
+                    "API_GLOBAL_RATE": "1000000", "API_GLOBAL_BURST": "100000",
+                    "LEAD_RATE": "100000", "LEAD_BURST": "1000",
+                    # Синтетический пользователь отвечает быстрее человека
+                    "THROTTLE_POLICY": "off"})
+    return env
+
+
+class LoadTest:
+    def __init__(self, args, stub, survey):
+        self.args = args
+        self.stub = stub
+        self.survey = survey
+        self.url = f"http://127.0.0.1:{args.port}/webhook"
+        self.update_ids = itertools.count(1)
+        self.latencies = []
+        self.updates = 0
+        self.completed = 0
+        self.banned = 0
+        self.errors = 0
+
+    def update(self, user_id, text):
+        n = next(self.update_ids)
+        return {"update_id": n, "message": {
+            "message_id": n, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}",
+                     "username": f"user{user_id}"}}}
+
+    async def run_user(self, http, user_id, rng, semaphore):
+        steps, banned = build_scenario(self.survey, rng, self.args)
+        async with semaphore:
+            for text, expected in steps:
+                target = self.stub.count(user_id) + expected
+                started = time.perf_counter()
+                try:
+                    async with http.post(self.url, json=self.update(user_id, text)) as resp:
+                        if resp.status != 200:
+                            self.errors += 1
+                            return
+                    await self.stub.wait_for(user_id, target, self.args.step_timeout)
+                except (asyncio.TimeoutError, aiohttp.ClientError):
+                    self.errors += 1
+                    return
+                self.latencies.append(time.perf_counter() - started)
+                self.updates += 1
+                if self.args.think_time:
+                    await asyncio.sleep(rng.uniform(0, self.args.think_time))
+        if banned:
+            self.banned += 1
+        else:
+            self.completed += 1
+
+    async def run(self):
+        rng = random.Random(self.args.seed)
+        semaphore = asyncio.Semaphore(self.args.concurrency or self.args.users)
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency or self.args.users)
+        async with aiohttp.ClientSession(connector=connector) as http:
+            await asyncio.gather(*(
+                self.run_user(http, 1_000_000 + i, random.Random(rng.random()), semaphore)
+                for i in range(self.args.users)))
+
+
+async def main(args):
+    survey = SurveyCache(os.path.join(ROOT, QUESTIONS_FILE)).get()
+    stub = StubBotAPI(latency=args.api_latency / 1000)
+    await stub.start(port=args.api_port)
+    workdir = tempfile.mkdtemp(prefix="tgbot-bench-")
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=ROOT,
+                            env=bot_env(args, workdir),
+                            stdout=None if args.verbose else subprocess.DEVNULL)
+    try:
+        await wait_port(args.port)
+        if args.workers > 1:
+            for i in range(args.workers):
+                await wait_port(args.port + 100 + i)
+        rss_before = rss_kb(proc.pid)
+        test = LoadTest(args, stub, survey)
+        started = time.perf_counter()
+        await test.run()
+        elapsed = time.perf_counter() - started
+        rss_after = rss_kb(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        await asyncio.to_thread(proc.wait)
+        await stub.close()
+
+    lat = [x * 1000 for x in test.latencies]
+    report = {
+        "users": args.users,
+        "workers": max(1, args.workers),
+        "elapsed_s": round(elapsed, 3),
+        "surveys_completed": test.completed,
+        "users_banned": test.banned,
+        "errors": test.errors,
+        "updates": test.updates,
+        "updates_per_s": round(test.updates / elapsed, 1) if elapsed else 0.0,
+        "surveys_per_s": round(test.completed / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(lat, 50), 2),
+            "p95": round(percentile(lat, 95), 2),
+            "p99": round(percentile(lat, 99), 2),
+            "max": round(max(lat), 2) if lat else 0.0,
+            "mean": round(statistics.fmean(lat), 2) if lat else 0.0,
+        },
+        "rss_kb": {"before": rss_before, "after": rss_after, "growth": rss_after - rss_before},
+        "api_calls": dict(stub.calls),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=1000, help="сколько пользователей проходят опрос")
+    p.add_argument("--concurrency", type=int, default=0, help="одновременно активных (0 — все сразу)")
+    p.add_argument("--workers", type=int, default=0, help="SCALE_WORKERS для бота (0 — один процесс)")
+    p.add_argument("--storage", choices=("memory", "sqlite"), default="memory")
+    p.add_argument("--port", type=int, default=18080, help="порт webhook бота")
+    p.add_argument("--api-port", type=int, default=18081, help="порт заглушки Bot API")
+    p.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушки, мс")
+    p.add_argument("--think-time", type=float, default=0.0, help="макс. пауза пользователя между шагами, с")
+    p.add_argument("--under18", type=float, default=0.05, help="доля пользователей младше 18")
+    p.add_argument("--other", type=float, default=0.3, help="доля выбравших «Другое»")
+    p.add_argument("--invalid", type=float, default=0.1, help="доля ошибочных ответов")
+    p.add_argument("--step-timeout", type=float, default=60.0)
+    p.add_argument("--real-limits", action="store_true", help="не отключать лимиты частоты Telegram и флуд-контроль")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--output", help="сохранить отчёт в JSON")
+    p.add_argument("--verbose", action="store_true", help="показывать вывод бота")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
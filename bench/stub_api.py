@@ -0,0 +1,67 @@
+"""Заглушка Bot API для нагрузочных тестов: отвечает как Telegram и считает вызовы по чатам."""
+import asyncio
+import itertools
+from collections import defaultdict
+
+from aiohttp import web
+
+
+class StubBotAPI:
+    def __init__(self, latency=0.0):
+        # Искусственная задержка ответа, чтобы имитировать сеть до api.telegram.org
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self.sent = defaultdict(int)
+        self._conditions = defaultdict(asyncio.Condition)
+        self._ids = itertools.count(1)
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = None
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = int(data.get("chat_id") or 0)
+        message = {"message_id": next(self._ids), "date": 0,
+                   "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendPhoto":
+            message["photo"] = [{"file_id": f"stub-{next(self._ids)}", "file_unique_id": "stub",
+                                 "width": 1, "height": 1}]
+        if method.startswith("send"):
+            result = message
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        else:
+            result = True
+        if method == "sendMessage":
+            cond = self._conditions[chat_id]
+            async with cond:
+                self.sent[chat_id] += 1
+                cond.notify_all()
+        return web.json_response({"ok": True, "result": result})
+
+    def count(self, chat_id):
+        return self.sent[chat_id]
+
+    async def wait_for(self, chat_id, count, timeout):
+        """Ждёт, пока в чат уйдёт count сообщений sendMessage (всего с начала теста)."""
+        cond = self._conditions[chat_id]
+        async with cond:
+            await asyncio.wait_for(cond.wait_for(lambda: self.sent[chat_id] >= count), timeout)
+
+    async def start(self, host="127.0.0.1", port=18081):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -1,22 +1,50 @@
 import asyncio
 import os
-import json
-import re
-from aiogram import Bot, Dispatcher, F
+import signal
+import time
+from dotenv import load_dotenv
+
+STARTED = time.perf_counter()
+
+# До импорта остальных модулей: они читают настройки из окружения при импорте
+load_dotenv()
+if __name__ == "__main__" and os.getenv("FAST_STARTUP", "0") == "1":
+    # Порт слушается сразу, а этот модуль целиком (с aiogram) догружается в потоке
+    import startup
+    startup.run()
+    raise SystemExit
+
+from aiogram import Bot, Dispatcher, F, Router
 from aiogram.enums import ParseMode
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.filters import StateFilter
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import FSInputFile
-from dotenv import load_dotenv
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from admin_panel import admin_router
+from survey_config import QUESTIONS_FILE, get_survey, survey_cache, thaw
+from survey_engine import AGE_BLOCK_MSG, render_final_phrase
+import survey_engine
+from media_registry import media_registry
+from sessions import SessionStorage, sessions
+from storage import make_backend
+from bans import BanMiddleware, banned_users
+from throttle import ThrottleMiddleware
+from ingest import WEBHOOK_MODE, UpdateDeduplicator, UpdateQueue
+from leads import LeadDelivery
+from lead_log import lead_log, lead_row
+from ratelimit import RateGovernor
+from scaleout import SCALE_WORKERS, ScaleOutFront, is_worker, worker_shard
+import metrics
+import profiler
+from startup import StartupTimer, file_signature, listen_address, load_snapshot, save_snapshot, snapshot_part
 
-load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
-QUESTIONS_FILE = "questions_data.json"
+# Свой Bot API сервер (например, локальная заглушка при проверке scale-out режима на одной машине)
+BOT_API_URL = os.getenv("BOT_API_URL")
 MEDIA_DIR = "media"
 
 ADMIN_ID = 7028215322  # ваш Telegram user_id
@@ -27,81 +55,44 @@ class SurveyState(StatesGroup):
     q = State()
     wait_custom_source = State()
 
-bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+def survey_step_label(data):
+    # raw_state кладёт FSM-middleware aiogram; STATE_STAGES объявлен ниже, берётся при вызове
+    return "survey_step:" + STATE_STAGES.get(data.get("raw_state"), "unknown")
+
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)) if BOT_API_URL else None
+bot = Bot(token=API_TOKEN, session=bot_session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Все исходящие запросы идут через общие лимиты Telegram; уведомления админу — в последнюю очередь
+rate_governor = RateGovernor(low_priority_chats={ADMIN_ID})
+bot.session.middleware(rate_governor)
+# Регистрируется после лимитов, поэтому меряет сам запрос без ожидания токена
+bot.session.middleware(metrics.ApiTimingMiddleware())
+# FSM-состояние и прогресс опроса хранятся в одной сессии с вытеснением по LRU/TTL
+dp = Dispatcher(storage=SessionStorage(sessions))
 dp.include_router(admin_router)
-
-def load_questions():
-    try:
-        with open(QUESTIONS_FILE, encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print("Error loading questions:", e)
-        return {"ru": [], "en": []}
-
-def lang_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="Русский")], [KeyboardButton(text="English")]],
-        resize_keyboard=True, one_time_keyboard=True)
-
-def start_keyboard(lang):
-    if lang == "en":
-        text = "START"
-    else:
-        text = "СТАРТ"
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=text)]],
-        resize_keyboard=True, one_time_keyboard=True)
-
-def choices_keyboard(choices, special_layout=False):
-    if special_layout and len(choices) >= 4:
-        rows = [choices[:2], choices[2:4]]
-        rest = choices[4:]
-        for r in rest:
-            rows.append([r])
-        return ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text=ch) for ch in row] for row in rows],
-            resize_keyboard=True, one_time_keyboard=True
-        )
-    else:
-        return ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text=ch)] for ch in choices],
-            resize_keyboard=True, one_time_keyboard=True)
-
-user_state = {}
-
-WELCOME_TEXT = {
-    "ru": """Благодарим за интерес к нашему проекту. Сейчас вы пройдёте короткий опрос — это поможет нам лучше понять ваши цели и подобрать для вас максимально подходящий путь обучения.
-
-FCK Academy (от англ. Finance Crypto Knowledge) — современная образовательная платформа с более чем 4-летним опытом в сфере криптовалют и цифровых инвестиций. Мы обучаем не теории, а реальной торговле в DeFi секторе: каждый студент работает с живым рынком под руководством профессионалов.
-
-За это время FCK Academy прошли более 1600 студентов. Из них 82 % начали получать доход в первую неделю, а 68 % — сформировали устойчивый инвестиционный портфель за 14 дней. Средняя прибыль по сделкам под кураторским сопровождением составляет от 13 % до 21 % в неделю, в зависимости от стратегии и уровня вовлечённости.
-
-Над результатами студентов работают более 12 опытных кураторов, доступных 24/7. Обучение строится на четырёх ключевых принципах:
-
-— Постоянная практика на реальном рынке  
-— Поддержка на каждом этапе  
-— Возможность зарабатывать из любой точки мира""",
-    "en": "Thank you for your interest in our project. Now you will take a short survey — this will help us better understand your goals and find the most suitable learning path for you."
-}
-
-ERROR_MSG = {
-    "ru": "Дай ответ более корректно и открыто",
-    "en": "Please answer more clearly and openly"
-}
-
-AGE_BLOCK_MSG = {
-    "ru": "Извините, наш сервис только для лиц старше 18 лет. Доступ закрыт.",
-    "en": "Sorry, our service is only for people over 18 years old. Access denied."
-}
-
-def render_final_phrase(phrase: str, contact_link: str) -> str:
-    link = contact_link.strip()
-    if not link.startswith("@"):
-        link = f"@{link}"
-    return phrase.replace("{contact_link}", link)
-
-async def send_results_to_admin(user, answers, bot, contact_link, final_phrase):
+# Подключается последним, чтобы не перехватывать /admin и прочие команды
+fallback_router = Router()
+dp.include_router(fallback_router)
+# Inner-middleware наследуются вложенными роутерами — достаточно одного на dp, иначе хендлер меряется дважды.
+# Все шаги опроса идут через survey_step — время пишется отдельно по этапам движка
+dp.message.middleware(metrics.HandlerTimingMiddleware(labels={"survey_step": survey_step_label}))
+lead_delivery = LeadDelivery(bot, ADMIN_ID)
+
+def resubmit_update(update, user_id):
+    # Отложенный флуд-контролем апдейт встаёт в очередь своего пользователя, а не обрабатывается сбоку
+    return update_queue.submit(update, user_id)
+
+THROTTLE_MSG = "Слишком много сообщений, подождите немного.\nToo many messages, please wait a bit."
+
+# Флуд-контроль и баны проверяются до FSM: переставляем FSM-middleware после наших.
+# Флуд-контроль первым — иначе забаненный спамер получал бы ответ на каждое сообщение
+ban_middleware = BanMiddleware(banned_users, AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"], exempt={ADMIN_ID})
+throttle_middleware = ThrottleMiddleware(notice=THROTTLE_MSG, exempt={ADMIN_ID}, resubmit=resubmit_update)
+dp.update.outer_middleware.unregister(dp.fsm)
+dp.update.outer_middleware(throttle_middleware)
+dp.update.outer_middleware(ban_middleware)
+dp.update.outer_middleware(dp.fsm)
+
+def format_lead(user, answers, contact_link, final_phrase):
     user_info = f"@{user.username}" if user.username else ""
     text = (
         f"Новые ответы пользователя:\n"
@@ -115,269 +106,294 @@ async def send_results_to_admin(user, answers, bot, contact_link, final_phrase):
         text += f"{k}: {v}\n"
     text += f"\nКонтакт для пользователя: {contact_link}"
     text += f"\nФраза для пользователя: {render_final_phrase(final_phrase, contact_link)}"
-    await bot.send_message(ADMIN_ID, text)
-
-banned_users = set()
-
-def is_only_digits(text):
-    return text.isdigit()
-
-def is_text_with_letters_ratio(text, min_ratio=0.7):
-    letters = re.findall(r'[a-zA-Zа-яА-ЯёЁ]', text)
-    length = len(text.replace(" ", ""))
-    if length == 0:
-        return False
-    letter_ratio = len(letters) / length
-    return letter_ratio >= min_ratio
-
-def is_text_with_letters_ratio_or_digits(text, min_ratio=0.5):
-    letters = re.findall(r'[a-zA-Zа-яА-ЯёЁ]', text)
-    length = len(text.replace(" ", ""))
-    if length == 0:
-        return False
-    letter_ratio = len(letters) / length
-    return letter_ratio >= min_ratio
-
-@dp.message(F.text.lower().in_({"/start", "start"}))
-async def welcome(message: Message, state: FSMContext):
-    if message.from_user.id in banned_users:
-        await message.answer(AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"])
-        return
-    await state.clear()
-    user_state[message.from_user.id] = {"answers": {}}  # Не задаём язык заранее!
-    await message.answer("Выберите язык / Select language:", reply_markup=lang_keyboard())
-    await state.set_state(SurveyState.lang)
-
-@dp.message(SurveyState.lang)
-async def choose_lang(message: Message, state: FSMContext):
-    if message.from_user.id in banned_users:
-        await message.answer(AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"])
-        return
-    text = message.text.strip().lower()
-    if text in ("русский", "рус", "ru"):
-        lang = "ru"
-    elif text in ("english", "en"):
-        lang = "en"
-    else:
-        await message.answer("Пожалуйста, выберите язык / Please select a language:", reply_markup=lang_keyboard())
-        return
-    user_state[message.from_user.id]["lang"] = lang
-    logo_path = os.path.join(MEDIA_DIR, "logo.jpg")
-    if os.path.exists(logo_path):
-        await message.answer_photo(FSInputFile(logo_path))
-    await message.answer(WELCOME_TEXT[lang])
-    await message.answer("Начнем опрос! / Let's start the survey!", reply_markup=start_keyboard(lang))
-    await state.set_state(SurveyState.wait_start)
-
-@dp.message(SurveyState.wait_start)
-async def start_survey(message: Message, state: FSMContext):
-    if message.from_user.id in banned_users:
-        await message.answer(AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"])
-        return
-    user_id = message.from_user.id
-    lang = user_state[user_id].get("lang", "ru")
-    expected = "старт" if lang == "ru" else "start"
-    if message.text.strip().lower() != expected:
-        msg = "Нажмите кнопку 'СТАРТ'!" if lang == "ru" else "Press the 'START' button!"
-        await message.answer(msg, reply_markup=start_keyboard(lang))
-        return
-    data = load_questions()
-    user_state[user_id]["q_idx"] = 0
-    user_state[user_id]["skip_next"] = False
-    await ask_next_question(message, user_id, lang, data, state)
-    await state.set_state(SurveyState.q)
-
-async def ask_next_question(message, user_id, lang, data, state):
-    questions = data.get(lang, [])
-    idx = user_state[user_id].get("q_idx", 0)
-    while idx < len(questions):
-        q = questions[idx]
-        if "depends_on" in q:
-            dep_idx = q["depends_on"]["question_idx"]
-            dep_vals = [v.lower() for v in q["depends_on"]["values"]]
-            prev_answer = user_state[user_id]["answers"].get(f"q{dep_idx+1}", "").strip().lower()
-            if prev_answer not in dep_vals:
-                idx += 1
-                user_state[user_id]["q_idx"] = idx
-                continue
-        img_name = f"{idx+1}.jpg"
-        img_path = os.path.join(MEDIA_DIR, img_name)
-        show_image = True
-        if "depends_on" in q:
-            dep_idx = q["depends_on"]["question_idx"]
-            prev_answer = user_state[user_id]["answers"].get(f"q{dep_idx+1}", "").strip().lower()
-            if prev_answer not in [v.lower() for v in q["depends_on"]["values"]]:
-                show_image = False
-        if show_image and os.path.exists(img_path):
-            await message.answer_photo(FSInputFile(img_path))
-        is_source_q = ("узнали про компанию" in q["question"].lower() or "how did you hear about" in q["question"].lower())
-        if q["type"] == "choice":
-            kb = choices_keyboard(
-                q["choices"],
-                special_layout=is_source_q
-            )
-        else:
-            kb = ReplyKeyboardRemove()
-        await message.answer(q["question"], reply_markup=kb)
-        break
+    return text
+
+async def send_results_to_admin(user, answers, contact_link, final_phrase):
+    # Не ждём Telegram: лид уходит админу из фоновой очереди с ограничением частоты
+    lead_delivery.submit(format_lead(user, answers, contact_link, final_phrase))
+
+def ban_user(user_id):
+    # Дальше все апдейты пользователя отсекает BanMiddleware
+    banned_users.add(user_id)
+
+async def get_session(message, state):
+    # Сессия могла быть вытеснена между сообщениями — тогда чистый перезапуск вместо KeyError
+    session = sessions.get(message.from_user.id)
+    if session is None:
+        await welcome(message, state)
+    return session
+
+# Этапы движка опроса <-> FSM-состояния aiogram
+STAGE_STATES = {
+    survey_engine.LANG: SurveyState.lang,
+    survey_engine.WAIT_START: SurveyState.wait_start,
+    survey_engine.QUESTION: SurveyState.q,
+    survey_engine.OTHER_TEXT: SurveyState.wait_custom_source,
+}
+STATE_STAGES = {state.state: stage for stage, state in STAGE_STATES.items()}
+
+def pinned_survey(session):
+    """Версия опроса, закреплённая за сессией: ответы не разъедутся с вопросами после правки конфига."""
+    if STATE_STAGES.get(session.state) in (survey_engine.LANG, survey_engine.WAIT_START):
+        # Вопросы ещё не начались — берём свежую версию и закрепляем её
+        survey = get_survey()
     else:
-        contact_link = data.get("contact_link", "@manager")
-        final_phrase = data.get("final_phrase",
-            {
-                "ru": f"Спасибо! Напишите нашему менеджеру {contact_link} для дальнейших инструкций.",
-                "en": f"Thank you! Please message our manager {contact_link} for further instructions."
-            }
-        )
-        lang_final_phrase = final_phrase[lang] if isinstance(final_phrase, dict) else final_phrase
-        final_phrase_ready = render_final_phrase(lang_final_phrase, contact_link)
-        await message.answer(final_phrase_ready, reply_markup=ReplyKeyboardRemove())
-        await send_results_to_admin(
-            message.from_user,
-            user_state[user_id]["answers"],
-            bot,
-            contact_link,
-            lang_final_phrase
-        )
+        # Версии может уже не быть (рестарт) — тогда текущая, движок сам завершит опрос за её концом
+        survey = session.survey or survey_cache.version(session.survey_digest) or get_survey()
+    session.survey = survey
+    session.survey_digest = survey.digest
+    return survey
+
+def session_progress(session):
+    return survey_engine.Progress(
+        STATE_STAGES.get(session.state, survey_engine.DONE), session.lang, session.q_idx, session.answers)
+
+async def apply_step(message, state, session, survey, progress, actions):
+    """Сохраняет новый прогресс в сессию и исполняет действия движка."""
+    session.lang = progress.lang
+    session.q_idx = progress.q_idx
+    session.answers = progress.answers
+    session.awaiting_manual_source = progress.stage == survey_engine.OTHER_TEXT
+    lang = progress.lang or "ru"
+    for action in actions:
+        if isinstance(action, survey_engine.Send):
+            await message.answer(action.text, reply_markup=action.keyboard)
+        elif isinstance(action, survey_engine.Photo):
+            await media_registry.send_photo(message, os.path.join(MEDIA_DIR, action.name))
+        elif isinstance(action, survey_engine.Lead):
+            lead_log.append(lead_row(message.from_user, lang, survey, action.answers))
+            await send_results_to_admin(
+                message.from_user, action.answers, action.contact_link, action.final_phrase)
+        elif action.kind == "question":
+            metrics.survey_question_reached.inc(lang, action.idx)
+        elif action.kind == "invalid":
+            metrics.validation_failures.inc(lang, action.idx)
+        elif action.kind == "started":
+            metrics.survey_started.inc(lang)
+        elif action.kind == "completed":
+            metrics.survey_completed.inc(lang)
+        elif action.kind == "banned":
+            ban_user(message.from_user.id)
+            metrics.survey_banned.inc(lang)
+    next_state = STAGE_STATES.get(progress.stage)
+    if next_state is None:
+        # Опрос закончен — отпускаем версию, иначе она жила бы до истечения сессии
+        session.survey = None
+        session.survey_digest = None
         await state.clear()
-        return
-    user_state[user_id]["q_idx"] = idx
+    else:
+        await state.set_state(next_state)
 
-@dp.message(SurveyState.q)
-async def handle_answer(message: Message, state: FSMContext):
-    if message.from_user.id in banned_users:
-        await message.answer(AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"])
-        await state.clear()
+# "start" без слеша — тоже перезапуск, кроме экрана с кнопкой START у англоязычных
+@dp.message(F.text.lower() == "/start")
+@dp.message(~StateFilter(SurveyState.wait_start), F.text.lower() == "start")
+async def welcome(message: Message, state: FSMContext):
+    await state.clear()
+    session = sessions.reset(message.from_user.id)  # Не задаём язык заранее!
+    progress, actions = survey_engine.start()
+    await apply_step(message, state, session, None, progress, actions)
+
+# Все этапы опроса — один адаптер: сессия -> движок -> действия
+@dp.message(StateFilter(*STAGE_STATES.values()))
+async def survey_step(message: Message, state: FSMContext):
+    session = await get_session(message, state)
+    if session is None:
         return
-    user_id = message.from_user.id
-    lang = user_state[user_id].get("lang", "ru")
-    data = load_questions()
-    idx = user_state[user_id]["q_idx"]
-    questions = data[lang]
-    q = questions[idx]
-    q_text_lower = q["question"].lower()
-
-    error_msg = ERROR_MSG[lang]
-
-    # 1. "Сколько вам лет?" / "How old are you?" — только цифры, >= 18
-    if (
-        ("сколько вам лет" in q_text_lower) or
-        ("how old are you" in q_text_lower)
-    ):
-        if not is_only_digits(message.text.strip()):
-            await message.answer(error_msg)
-            return
-        age = int(message.text.strip())
-        if age < 18:
-            banned_users.add(user_id)
-            await message.answer(AGE_BLOCK_MSG[lang])
-            await state.clear()
-            return
-    # 2. Вопрос про доход — минимум 50% букв
-    elif (
-        ("какой доход вы хотите получать" in q_text_lower) or
-        ("what income would you like to receive" in q_text_lower)
-    ):
-        if not is_text_with_letters_ratio_or_digits(message.text.strip(), min_ratio=0.5):
-            await message.answer(error_msg)
-            return
-    # 3. Остальные текстовые вопросы — минимум 70% букв
-    elif q["type"] == "text":
-        if not is_text_with_letters_ratio(message.text.strip(), min_ratio=0.7):
-            await message.answer(error_msg)
-            return
+    survey = pinned_survey(session)
+    progress, actions = survey_engine.step(survey, session_progress(session), message.text)
+    await apply_step(message, state, session, survey, progress, actions)
 
-    is_source_q = (
-        "узнали про компанию" in q_text_lower or
-        "how did you hear about" in q_text_lower
-    )
-    if q["type"] == "choice":
-        if is_source_q:
-            other_variants = ["другое", "other"]
-            if message.text.strip().lower() in other_variants:
-                user_state[user_id]["awaiting_manual_source"] = True
-                await state.set_state(SurveyState.wait_custom_source)
-                msg = "Пожалуйста, напишите свой вариант (не менее 5 символов):" if lang == "ru" else "Please write your own option (at least 5 characters):"
-                await message.answer(
-                    msg,
-                    reply_markup=ReplyKeyboardRemove()
-                )
-                return
-            valid_choices = [ch.strip() for ch in q["choices"]]
-            if message.text.strip() not in valid_choices:
-                await message.answer(error_msg, reply_markup=choices_keyboard(valid_choices, special_layout=True))
-                return
-        else:
-            valid_choices = [ch.strip() for ch in q["choices"]]
-            if message.text.strip() not in valid_choices:
-                await message.answer(error_msg, reply_markup=choices_keyboard(valid_choices))
-                return
-
-    user_state[user_id]["answers"][f"q{idx+1}"] = message.text
-    is_exp_q = (
-        "опыт в сфере криптовалют" in q_text_lower or
-        "experience in cryptocurrencies" in q_text_lower
-    )
-    if is_exp_q:
-        if message.text.strip().lower() in ["нет", "no"]:
-            for i in range(idx + 1, len(questions)):
-                qn = questions[i]
-                if "depends_on" in qn and qn["depends_on"]["question_idx"] == idx:
-                    user_state[user_id]["q_idx"] = i + 1
-                    break
-            else:
-                user_state[user_id]["q_idx"] = idx + 1
-        else:
-            user_state[user_id]["q_idx"] = idx + 1
-    else:
-        user_state[user_id]["q_idx"] = idx + 1
-    await ask_next_question(message, user_id, lang, data, state)
-
-@dp.message(SurveyState.wait_custom_source)
-async def handle_manual_source(message: Message, state: FSMContext):
-    user_id = message.from_user.id
-    lang = user_state[user_id].get("lang", "ru")
-    if user_id in banned_users:
-        await message.answer(AGE_BLOCK_MSG["ru"] + "\n" + AGE_BLOCK_MSG["en"])
-        await state.clear()
-        return
-    min_len = 5
-    if len(message.text.strip()) < min_len:
-        await message.answer(ERROR_MSG[lang])
-        return
-    idx = user_state[user_id]["q_idx"]
-    user_state[user_id]["answers"][f"q{idx+1}"] = message.text
-    user_state[user_id]["q_idx"] = idx + 1
-    data = load_questions()
-    await state.set_state(SurveyState.q)
-    await ask_next_question(message, user_id, lang, data, state)
+@fallback_router.message(StateFilter(None))
+async def restart_expired(message: Message, state: FSMContext):
+    # Сессии нет (новый пользователь или вытеснена по TTL/LRU) — начинаем заново
+    if sessions.get(message.from_user.id) is None:
+        await welcome(message, state)
 
 from aiohttp import web
 
 WEBHOOK_HOST = os.getenv("WEBHOOK_URL")  # Например, https://tg-bot-xxxxx.onrender.com
 WEBHOOK_PATH = "/webhook"
+WEBHOOK_PORT = int(os.getenv("PORT", "10000"))
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
 
 async def on_startup(bot):
+    # Повторный set_webhook при каждом рестарте не нужен, если Telegram уже шлёт сюда
+    try:
+        info = await bot.get_webhook_info()
+        if info.url == WEBHOOK_URL:
+            print("Webhook already set")
+            return
+    except Exception as e:
+        print("Error getting webhook info:", e)
     await bot.set_webhook(WEBHOOK_URL)
 
-async def handle(request):
-    update = await request.json()
+async def process_update(update):
     await dp.feed_webhook_update(bot=bot, update=update)
-    return web.Response()
 
-async def main():
+update_queue = UpdateQueue(process_update)
+deduplicator = UpdateDeduplicator()
+
+metrics.registry.gauge("bot_active_sessions", "Сессии в памяти", lambda: len(sessions))
+metrics.registry.callback_counter(
+    "survey_config_reloads_total", "Перезагрузки конфига опроса", lambda: survey_cache.reloads)
+metrics.register_stats("bot_sessions", "Счётчики хранилища сессий", sessions.stats)
+metrics.register_stats("bot_survey_versions", "Версии опроса в памяти", survey_cache.stats)
+metrics.register_stats("bot_ingest_queue", "Очередь входящих апдейтов", update_queue.stats)
+metrics.register_stats("bot_dedup", "Отсечение повторных апдейтов", deduplicator.stats)
+metrics.register_stats("bot_lead_delivery", "Отправка лидов админу", lead_delivery.stats)
+metrics.register_stats("bot_lead_log", "Журнал лидов", lead_log.stats)
+metrics.register_stats("bot_bans", "Баны", banned_users.stats)
+metrics.register_stats("bot_ban_middleware", "Отсечённые апдейты забаненных", ban_middleware.stats)
+metrics.register_stats("bot_throttle", "Флуд-контроль входящих апдейтов", throttle_middleware.stats)
+metrics.register_stats("bot_api_governor", "Лимиты исходящих запросов", rate_governor.stats)
+
+async def accept(update):
+    """Принимает сырой апдейт; возвращает HTTP-статус ответа Telegram."""
+    # Повтор от Telegram: подтверждаем, но второй раз не обрабатываем
+    if not deduplicator.add(update.get("update_id")):
+        return 200
+    if WEBHOOK_MODE == "sync":
+        await process_update(update)
+        return 200
+    # Отвечаем Telegram сразу, обработка идёт в очереди пользователя; при переполнении пусть повторит позже
+    if not update_queue.submit(update):
+        deduplicator.discard(update.get("update_id"))
+        return 503
+    return 200
+
+async def accept_early(update):
+    # Telegram уже получил 200 от раннего слушателя — такой апдейт терять нельзя
+    if await accept(update) == 503:
+        deduplicator.add(update.get("update_id"))
+        await process_update(update)
+
+async def handle(request):
+    return web.Response(status=await accept(await request.json()))
+
+def load_startup_state():
+    """Конфиг опроса и карта file_id: из снимка, если исходные файлы не менялись."""
+    snapshot = load_snapshot()
+    data = snapshot_part(snapshot, "survey", QUESTIONS_FILE)
+    if data is not None:
+        survey_cache.publish(data)
+    else:
+        get_survey()
+    file_ids = snapshot_part(snapshot, "media", media_registry.cache_file)
+    media_registry.load(file_ids)
+    return data is not None and file_ids is not None
+
+async def write_startup_snapshot():
+    parts = {"media": (file_signature(media_registry.cache_file), media_registry.file_ids or {})}
+    # Кэш мог ещё не заметить правку файла: подпись снимаем до принудительной проверки
+    # и кладём опрос, только если опубликованная версия прочитана именно из этого файла
+    sig = file_signature(QUESTIONS_FILE)
+    survey = survey_cache.get(force=True)
+    if sig is not None and survey.mtime == sig[0] and not survey_cache.placeholder:
+        parts["survey"] = (sig, thaw(survey.data))
+    await asyncio.to_thread(save_snapshot, parts)
+
+async def wait_for_shutdown():
+    # SIGTERM/SIGINT завершают процесс штатно: очереди дорабатываются, хранилище сбрасывается
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+async def run_front():
+    front = ScaleOutFront(SCALE_WORKERS, os.path.abspath(__file__))
     app = web.Application()
-    app.router.add_post(WEBHOOK_PATH, handle)
+    app.router.add_post(WEBHOOK_PATH, front.handle)
+    # У воркеров свой /metrics на локальных портах
+    metrics.register_stats("bot_scaleout_front", "Фронт scale-out режима", front.stats)
+    app.router.add_get("/metrics", metrics.registry.handle)
 
     await on_startup(bot)
+    await front.start()
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", 10000)
+    site = web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT)
     await site.start()
 
-    print(f"Webhook running at {WEBHOOK_URL}")
-    while True:
-        await asyncio.sleep(3600)
+    print(f"Webhook running at {WEBHOOK_URL} with {SCALE_WORKERS} workers")
+    try:
+        await wait_for_shutdown()
+    finally:
+        await runner.cleanup()
+        await front.close()
+        await bot.session.close()
+
+async def main(early=None):
+    if SCALE_WORKERS > 1 and not is_worker():
+        await run_front()
+        return
+    # early — уже слушающий порт EarlyListener из startup.py (FAST_STARTUP=1)
+    if early is not None:
+        timer = early.timer
+    else:
+        timer = StartupTimer(STARTED)
+        timer.mark("import")
+
+    # Сессии и баны переживают рестарт: поднимаем их из хранилища до приёма апдейтов
+    # Воркер scale-out режима поднимает и чистит только строки своих пользователей
+    backend = make_backend(ttl=sessions.ttl, shard=worker_shard())
+    restored = sessions.attach(backend)
+    banned_users.attach(backend)
+    await backend.start()
+    if is_worker():
+        # Баны из админки приходят через общее хранилище от воркера админа
+        banned_users.start()
+    print(f"Restored {restored} sessions and {len(banned_users)} bans")
+    timer.mark("storage")
+    from_snapshot = load_startup_state()
+    timer.mark("config")
+    if from_snapshot:
+        print("Survey config and media file_ids loaded from startup snapshot")
+    update_queue.start()
+    lead_delivery.start()
+    lead_log.start()
+    profiler.lag_monitor.start()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    app.router.add_get("/metrics", metrics.registry.handle)
+    profiler.add_routes(app)
+
+    host, port = listen_address()
+    if early is not None:
+        buffered = len(early.buffer)
+        overflowed = await early.install(app, accept_early)
+        runner = early.runner
+        timer.mark("drain")
+        print(f"Processed {buffered} updates received during startup ({overflowed} deferred with 503)")
+    if not is_worker():
+        await on_startup(bot)
+        timer.mark("webhook")
+    if early is None:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        timer.mark("listen")
+
+    print(f"Webhook running at {WEBHOOK_URL}" if not is_worker() else f"Worker listening on {host}:{port}")
+    timer.report()
+    if not from_snapshot:
+        await write_startup_snapshot()
+    try:
+        await wait_for_shutdown()
+    finally:
+        await runner.cleanup()
+        await profiler.lag_monitor.close()
+        await update_queue.close()
+        await throttle_middleware.close()
+        await lead_delivery.close()
+        await lead_log.close()
+        await banned_users.close()
+        await backend.close()
+        # Карта file_id могла пополниться — следующий старт возьмёт её из снимка
+        await write_startup_snapshot()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
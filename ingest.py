@@ -0,0 +1,164 @@
+import asyncio
+import os
+from array import array
+from collections import deque
+
+# "queue" — апдейт кладётся в очередь и webhook сразу отвечает 200, "sync" — обработка в запросе
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queue")
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# Сколько пользователей обрабатываются одновременно. Ждущий своего лимита Bot API чат занимает
+# одно место, а не весь поток; без предела всплеск обрабатывается «все понемногу» и хвост задержек растёт
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "32"))
+# Сколько последних update_id помнить для отсечения повторов
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "10000"))
+
+UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "my_chat_member", "chat_member", "chat_join_request", "pre_checkout_query", "shipping_query",
+)
+
+
+def update_user_id(update):
+    """Id пользователя из сырого апдейта (dict), без построения pydantic-моделей."""
+    for kind in UPDATE_KINDS:
+        event = update.get(kind)
+        if event is None:
+            continue
+        user = event.get("from")
+        if user is not None:
+            return user.get("id")
+        chat = event.get("chat")
+        if chat is not None:
+            return chat.get("id")
+    return update.get("update_id", 0)
+
+
+class UpdateDeduplicator:
+    """Окно последних update_id фиксированного размера: кольцевой буфер + множество.
+
+    Повторная доставка апдейта Telegram'ом стоит одной проверки в множестве
+    вместо полного прогона хендлеров и лишних запросов к Bot API.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW):
+        self.window = max(1, window)
+        self._ring = array("q", [-1]) * self.window
+        self._seen = set()
+        self._pos = 0
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, update_id):
+        """True — апдейт новый, False — уже видели."""
+        if update_id is None:
+            return True
+        if update_id in self._seen:
+            self.hits += 1
+            return False
+        old = self._ring[self._pos]
+        if old != -1:
+            self._seen.discard(old)
+        self._ring[self._pos] = update_id
+        self._pos = (self._pos + 1) % self.window
+        self._seen.add(update_id)
+        self.misses += 1
+        return True
+
+    def discard(self, update_id):
+        """Забыть апдейт, который не удалось принять, чтобы повтор Telegram'а прошёл."""
+        self._seen.discard(update_id)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._seen)}
+
+
+class UpdateQueue:
+    """Ограниченная очередь апдейтов: у каждого пользователя своя очередь и своя задача.
+
+    Апдейты одного пользователя обрабатываются строго по порядку, разные
+    пользователи — независимо: пока один чат ждёт своего лимита Bot API
+    (~1 сообщение в секунду), остальные за ним не стоят. Задача пользователя
+    живёт, пока у него есть необработанные апдейты.
+    """
+
+    def __init__(self, process, maxsize=INGEST_QUEUE_SIZE, concurrency=INGEST_CONCURRENCY):
+        self.process = process
+        self.maxsize = max(1, maxsize)
+        # Очередь на семафор честная (FIFO) — пользователи получают место по порядку прихода
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        # user_id -> deque апдейтов; ключ есть, пока у пользователя работает задача
+        self._pending = {}
+        self._tasks = set()
+        self._depth = 0
+        self._started = False
+        self._closing = False
+        self.accepted = 0
+        self.processed = 0
+        self.overflowed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            for user_id in self._pending:
+                self._spawn(user_id)
+
+    def submit(self, update, user_id=None):
+        """Ставит апдейт в очередь пользователя. False — очередь переполнена или закрывается."""
+        if self._closing:
+            self.rejected += 1
+            return False
+        if self._depth >= self.maxsize:
+            self.overflowed += 1
+            return False
+        if user_id is None:
+            user_id = update_user_id(update)
+        queue = self._pending.get(user_id)
+        if queue is None:
+            queue = self._pending[user_id] = deque()
+            if self._started:
+                self._spawn(user_id)
+        queue.append(update)
+        self._depth += 1
+        self.accepted += 1
+        return True
+
+    def _spawn(self, user_id):
+        task = asyncio.create_task(self._drain(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, user_id):
+        queue = self._pending[user_id]
+        while queue:
+            update = queue.popleft()
+            try:
+                async with self._slots:
+                    await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print("Error processing update:", e)
+            finally:
+                self._depth -= 1
+        # Между проверкой и удалением нет await — следующий апдейт заведёт новую задачу
+        del self._pending[user_id]
+
+    async def close(self):
+        """Перестаёт принимать апдейты и дожидается обработки уже принятых."""
+        self._closing = True
+        self.start()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "depth": self._depth,
+            "users": len(self._pending),
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "overflowed": self.overflowed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
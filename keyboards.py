@@ -0,0 +1,36 @@
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+
+def lang_keyboard():
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text="Русский")], [KeyboardButton(text="English")]],
+        resize_keyboard=True, one_time_keyboard=True)
+
+def start_keyboard(lang):
+    if lang == "en":
+        text = "START"
+    else:
+        text = "СТАРТ"
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text)]],
+        resize_keyboard=True, one_time_keyboard=True)
+
+def choices_keyboard(choices, special_layout=False):
+    if special_layout and len(choices) >= 4:
+        rows = [choices[:2], choices[2:4]]
+        rest = choices[4:]
+        for r in rest:
+            rows.append([r])
+        return ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=ch) for ch in row] for row in rows],
+            resize_keyboard=True, one_time_keyboard=True
+        )
+    else:
+        return ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=ch)] for ch in choices],
+            resize_keyboard=True, one_time_keyboard=True)
+
+# Клавиатуры не меняются — строим pydantic-модели один раз и переиспользуем
+LANG_KEYBOARD = lang_keyboard()
+START_KEYBOARDS = {"ru": start_keyboard("ru"), "en": start_keyboard("en")}
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
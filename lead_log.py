@@ -0,0 +1,195 @@
+"""Журнал лидов: append-only файл JSON Lines и потоковая выгрузка в CSV/XLSX.
+
+Одна строка — один завершённый опрос в компактном виде:
+[время, user_id, username, язык, версия конфига, [ответы по индексам вопросов]].
+Хендлер только кладёт строку в буфер, на диск буфер уходит пачкой раз в
+LEAD_LOG_FLUSH_INTERVAL секунд. Каждая пачка пишется одним write() в файл,
+открытый с O_APPEND, поэтому воркеры scale-out режима могут писать в один файл.
+
+Выгрузка читает журнал построчно и не держит его в памяти целиком:
+
+    python lead_log.py leads.csv
+    python lead_log.py leads.xlsx --since 2026-01-01
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+# Пустое значение отключает журнал
+LEAD_LOG_PATH = os.getenv("LEAD_LOG_PATH", "leads.jsonl")
+LEAD_LOG_FLUSH_INTERVAL = float(os.getenv("LEAD_LOG_FLUSH_INTERVAL", "1.0"))
+
+# Первые колонки выгрузки, дальше — по колонке на вопрос
+EXPORT_HEADER = ["Линк Лида", "ID TG", "Username", "Язык", "Версия опроса", "Дата"]
+
+
+def lead_row(user, lang, survey, answers, ts=None):
+    questions = survey.questions(lang)
+    return [
+        int(ts if ts is not None else time.time()),
+        user.id,
+        user.username,
+        lang,
+        survey.digest,
+        # Пропущенные по depends_on вопросы остаются null, индексы колонок не съезжают
+        [answers.get(f"q{i+1}") for i in range(len(questions))],
+    ]
+
+
+class LeadLog:
+    def __init__(self, path=LEAD_LOG_PATH, flush_interval=LEAD_LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._task = None
+        self.appended = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def append(self, row):
+        if self.enabled:
+            self._buffer.append(row)
+            self.appended += 1
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.errors += 1
+                print("Error writing lead log:", e)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        payload = "".join(
+            json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows
+        ).encode("utf-8")
+        try:
+            await asyncio.to_thread(self._write, payload)
+        except Exception:
+            # Не теряем лиды: вернём их в начало буфера до следующей попытки
+            self._buffer[:0] = rows
+            raise
+        self.written += len(rows)
+
+    def _write(self, payload):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.flushes += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "appended": self.appended,
+            "written": self.written,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
+def iter_rows(path, since=None):
+    """Строки журнала по одной. Недописанная последняя строка (падение процесса) пропускается."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and row[0] < since:
+                continue
+            yield row
+
+
+def export_header(survey):
+    width = max(len(survey.questions("ru")), len(survey.questions("en")))
+    ru = survey.questions("ru")
+    # Первая строка текста вопроса, без пояснений ниже
+    return EXPORT_HEADER + [ru[i].text.split("\n")[0] if i < len(ru) else f"q{i+1}" for i in range(width)]
+
+
+def export_record(row):
+    ts, user_id, username, lang, version, answers = row
+    link = f"https://t.me/{username}" if username else f"tg://user?id={user_id}"
+    date = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    return [link, user_id, username or "", lang, version, date] + [a or "" for a in answers]
+
+
+def export_leads(out_path, survey, log_path=LEAD_LOG_PATH, since=None):
+    """Выгружает журнал в CSV или XLSX (по расширению out_path). Возвращает число строк.
+
+    Блокирующая — из бота звать через asyncio.to_thread.
+    """
+    rows = (export_record(row) for row in iter_rows(log_path, since))
+    header = export_header(survey)
+    count = 0
+    if out_path.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("Для выгрузки в XLSX нужен пакет openpyxl") from None
+        # write_only пишет строки в файл по мере добавления, а не собирает лист в памяти
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Answers")
+        ws.append(header)
+        for record in rows:
+            ws.append(record)
+            count += 1
+        wb.save(out_path)
+    else:
+        # utf-8-sig — чтобы Excel открыл кириллицу без мастера импорта
+        with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for record in rows:
+                writer.writerow(record)
+                count += 1
+    return count
+
+
+lead_log = LeadLog()
+
+
+def main(argv=None):
+    from survey_config import get_survey
+
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("output", help="файл выгрузки: .csv или .xlsx")
+    p.add_argument("--log", default=LEAD_LOG_PATH, help="журнал лидов")
+    p.add_argument("--since", help="только лиды с этой даты (ГГГГ-ММ-ДД)")
+    args = p.parse_args(argv)
+    since = datetime.strptime(args.since, "%Y-%m-%d").timestamp() if args.since else None
+    count = export_leads(args.output, get_survey(), args.log, since)
+    print(f"Exported {count} leads to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from ratelimit import TokenBucket
+
+# Лимит Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+
+# Сообщений админу в секунду и запас на всплеск
+LEAD_RATE = float(os.getenv("LEAD_RATE", "1"))
+LEAD_BURST = int(os.getenv("LEAD_BURST", "3"))
+# Склеивать несколько лидов в одно сообщение (дайджест) и сколько секунд их копить
+LEAD_DIGEST = os.getenv("LEAD_DIGEST", "0") == "1"
+LEAD_DIGEST_WAIT = float(os.getenv("LEAD_DIGEST_WAIT", "2"))
+LEAD_MAX_ATTEMPTS = int(os.getenv("LEAD_MAX_ATTEMPTS", "5"))
+
+DIGEST_SEPARATOR = "\n\n———\n\n"
+
+
+def split_text(text, limit=MESSAGE_LIMIT):
+    """Режет слишком длинный текст по строкам, чтобы каждая часть влезла в сообщение."""
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+class LeadDelivery:
+    """Фоновая отправка лидов админу: очередь, token bucket, учёт retry_after и дайджесты.
+
+    Пользователь получает финальную фразу сразу, уведомление админу уходит отсюда.
+    """
+
+    def __init__(self, bot, chat_id, rate=LEAD_RATE, burst=LEAD_BURST, digest=LEAD_DIGEST,
+                 digest_wait=LEAD_DIGEST_WAIT, max_attempts=LEAD_MAX_ATTEMPTS):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.bucket = TokenBucket(rate, burst)
+        self.digest = digest
+        self.digest_wait = digest_wait
+        self.max_attempts = max_attempts
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._carry = None
+        self.submitted = 0
+        self.sent_messages = 0
+        self.sent_leads = 0
+        self.retries = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, text):
+        self._queue.put_nowait(text)
+        self.submitted += 1
+
+    def depth(self):
+        return self._queue.qsize()
+
+    async def _collect(self, first):
+        """Добирает в дайджест лиды из очереди, пока влезают в одно сообщение."""
+        leads = [first]
+        length = len(first)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.digest_wait
+        while True:
+            try:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    text = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    text = self._queue.get_nowait()
+            except asyncio.TimeoutError:
+                break
+            if length + len(DIGEST_SEPARATOR) + len(text) > MESSAGE_LIMIT:
+                # Не влезает — отправим первым в следующем сообщении
+                self._carry = text
+                break
+            leads.append(text)
+            length += len(DIGEST_SEPARATOR) + len(text)
+        return leads
+
+    async def _run(self):
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = await self._queue.get()
+            leads = [first]
+            try:
+                if self.digest:
+                    leads = await self._collect(first)
+                for part in split_text(DIGEST_SEPARATOR.join(leads)):
+                    await self._send(part)
+                self.sent_leads += len(leads)
+            except Exception as e:
+                self.failed += len(leads)
+                print("Error delivering lead:", e)
+            finally:
+                for _ in leads:
+                    self._queue.task_done()
+
+    async def _send(self, text):
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(self.chat_id, text)
+                self.sent_messages += 1
+                return
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                self.bucket.block(e.retry_after)
+            except TelegramAPIError:
+                attempt += 1
+                self.retries += 1
+                if attempt >= self.max_attempts:
+                    raise
+                await asyncio.sleep(min(30, 2 ** attempt))
+
+    async def close(self, timeout=10):
+        """Дожидается отправки накопленных лидов (не дольше timeout) и останавливает воркер."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Lead delivery stopped with {self.depth()} leads pending")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "submitted": self.submitted,
+            "sent_leads": self.sent_leads,
+            "sent_messages": self.sent_messages,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import time
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+MEDIA_CACHE_FILE = os.getenv("MEDIA_CACHE_FILE", "media_file_ids.json")
+
+# Как часто (в секундах) перепроверять, не изменился ли файл на диске
+CHECK_INTERVAL = float(os.getenv("MEDIA_CHECK_INTERVAL", "30"))
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MediaRegistry:
+    """Загружает каждую картинку в Telegram один раз и дальше шлёт по file_id.
+
+    Ключ — путь + sha1 содержимого, поэтому заменённый файл загрузится заново.
+    """
+
+    def __init__(self, cache_file=MEDIA_CACHE_FILE, check_interval=CHECK_INTERVAL):
+        self.cache_file = cache_file
+        self.check_interval = check_interval
+        # Загружается при первой отправке или заранее через load() (например, из снимка старта)
+        self.file_ids = None
+        # path -> (checked_at, (mtime_ns, size), digest или None если файла нет)
+        self._files = {}
+        self.uploads = 0
+        self.hits = 0
+
+    def load(self, file_ids=None):
+        if file_ids is not None:
+            self.file_ids = dict(file_ids)
+            return
+        self.file_ids = {}
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                self.file_ids = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Error loading media cache:", e)
+
+    def _save(self):
+        # Свой временный файл у каждого процесса — в режиме scale-out пишут несколько воркеров
+        tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.file_ids, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_file)
+        except Exception as e:
+            print("Error saving media cache:", e)
+
+    def key(self, path):
+        """Ключ кэша для файла или None, если файла нет."""
+        now = time.monotonic()
+        cached = self._files.get(path)
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[2]
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._files[path] = (now, None, None)
+            return None
+        sig = (st.st_mtime_ns, st.st_size)
+        if cached is not None and cached[1] == sig:
+            key = cached[2]
+        else:
+            key = f"{path}:{file_digest(path)}"
+        self._files[path] = (now, sig, key)
+        return key
+
+    def remember(self, key, file_id):
+        if self.file_ids.get(key) != file_id:
+            self.file_ids[key] = file_id
+            self._save()
+
+    def forget(self, key):
+        if self.file_ids.pop(key, None) is not None:
+            self._save()
+
+    async def send_photo(self, message, path, **kwargs):
+        """Отправляет фото, если файл существует. Возвращает отправленное сообщение или None."""
+        key = self.key(path)
+        if key is None:
+            return None
+        if self.file_ids is None:
+            self.load()
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            try:
+                sent = await message.answer_photo(file_id, **kwargs)
+                self.hits += 1
+                return sent
+            except TelegramBadRequest:
+                # file_id протух или принадлежит другому боту — загружаем заново
+                self.forget(key)
+        sent = await message.answer_photo(FSInputFile(path), **kwargs)
+        self.uploads += 1
+        if sent.photo:
+            self.remember(key, sent.photo[-1].file_id)
+        return sent
+
+
+media_registry = MediaRegistry()
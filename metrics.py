@@ -0,0 +1,206 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Отдаются на GET /metrics того же aiohttp-приложения, что принимает webhook.
+"""
+import time
+from bisect import bisect_left
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, value=1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Значение снимается функцией в момент запроса /metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, func, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                yield self.name, _labels(self.labelnames, labels), v
+        else:
+            yield self.name, "", value
+
+
+class CallbackCounter(Gauge):
+    """Счётчик, который уже ведёт другой объект (например, SurveyCache.reloads)."""
+
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., +Inf], сумма
+        self._values = {}
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", _labels(names, labels + (le,)), cumulative
+            yield self.name + "_sum", _labels(self.labelnames, labels), total
+            yield self.name + "_count", _labels(self.labelnames, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, func, labels=()):
+        return self.register(Gauge(name, help, func, labels))
+
+    def callback_counter(self, name, help, func, labels=()):
+        return self.register(CallbackCounter(name, help, func, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {value}")
+            except Exception as e:
+                print("Error collecting metric", metric.name, e)
+        lines.append("")
+        return "\n".join(lines)
+
+    async def handle(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_latency_seconds", "Время работы хендлера", ("handler",))
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("handler",))
+api_latency = registry.histogram(
+    "bot_api_request_latency_seconds", "Время запроса к Bot API", ("method",))
+api_errors = registry.counter(
+    "bot_api_request_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+survey_started = registry.counter(
+    "survey_started_total", "Начатые опросы", ("lang",))
+survey_question_reached = registry.counter(
+    "survey_question_reached_total",
+    "Сколько раз показан вопрос; разница соседних индексов — отвал на вопросе", ("lang", "idx"))
+survey_completed = registry.counter(
+    "survey_completed_total", "Завершённые опросы", ("lang",))
+survey_banned = registry.counter(
+    "survey_banned_total", "Заблокированы по возрасту", ("lang",))
+validation_failures = registry.counter(
+    "survey_validation_failures_total", "Ответы, не прошедшие валидацию", ("lang", "idx"))
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner-middleware: меряет время каждого хендлера по имени функции.
+
+    labels: имя хендлера -> функция(data), уточняющая метку (например, этап опроса
+    для общего хендлера всех шагов).
+    """
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", "unknown")
+        label = self.labels.get(name)
+        if label is not None:
+            name = label(data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Request-middleware для Bot: время и ошибки каждого метода Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started, name)
+
+
+def register_stats(name, help, stats):
+    """Публикует словарь stats() компонента (очереди, дедупликатор, лимиты) как gauge'и."""
+    return registry.gauge(
+        name, help,
+        lambda: {k: v for k, v in stats().items() if isinstance(v, (int, float))},
+        ("key",))
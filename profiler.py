@@ -0,0 +1,153 @@
+"""Диагностика event loop: мониторинг задержки цикла и профилирование по запросу.
+
+Монитор просыпается раз в LOOP_LAG_INTERVAL секунд и сравнивает фактическое
+время пробуждения с ожидаемым — если цикл был занят синхронной работой, это
+видно как задержка. cProfile включается только на время окна захвата, которое
+админ открывает и закрывает из /admin или через HTTP с PROFILE_TOKEN.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import time
+
+from aiohttp import web
+
+import metrics
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "1.0"))
+# С какой задержки (сек) писать в лог о занятом event loop
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+# asyncio debug-режим с логированием медленных колбэков — дорого, по умолчанию выключен
+SLOW_CALLBACK_DEBUG = os.getenv("SLOW_CALLBACK_DEBUG", "0") == "1"
+# Окно захвата закрывается само, если его забыли остановить
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "60"))
+
+loop_lag = metrics.registry.histogram(
+    "bot_event_loop_lag_seconds", "Задержка пробуждения event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+class LoopLagMonitor:
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.slow = 0
+        self._task = None
+
+    def start(self):
+        if SLOW_CALLBACK_DEBUG:
+            loop = asyncio.get_running_loop()
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.slow += 1
+                print(f"Event loop lag {lag * 1000:.0f} ms")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {"max_lag": self.max_lag, "slow": self.slow}
+
+
+class ProfileCapture:
+    """Окно захвата cProfile. Вне окна профилировщик не установлен и ничего не стоит."""
+
+    def __init__(self, max_seconds=PROFILE_MAX_SECONDS, top=PROFILE_TOP):
+        self.max_seconds = max_seconds
+        self.top = top
+        self._profile = None
+        self._started = 0.0
+        self._timer = None
+        self.last_report = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self):
+        if self.active:
+            return False
+        self._profile = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profile.enable()
+        self._timer = asyncio.get_running_loop().call_later(self.max_seconds, self._expire)
+        return True
+
+    def _expire(self):
+        if self.active:
+            print("Profile window closed after PROFILE_MAX_SECONDS")
+            self.stop()
+
+    def stop(self):
+        """Останавливает захват и возвращает (имя файла, текст отчёта) или None."""
+        if not self.active:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        duration = time.perf_counter() - self._started
+        out = io.StringIO()
+        out.write(f"Profile window: {duration:.1f} s\n\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        out.write("\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+        name = time.strftime("profile-%Y%m%d-%H%M%S.txt")
+        self.last_report = (name, out.getvalue())
+        return self.last_report
+
+
+lag_monitor = LoopLagMonitor()
+profile_capture = ProfileCapture()
+metrics.register_stats("bot_event_loop", "Мониторинг event loop", lag_monitor.stats)
+
+
+def _authorized(request):
+    token = request.headers.get("X-Profile-Token", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+async def handle_profile_start(request):
+    if not _authorized(request):
+        return web.Response(status=403)
+    started = profile_capture.start()
+    return web.Response(text="started\n" if started else "already running\n")
+
+
+async def handle_profile_stop(request):
+    if not _authorized(request):
+        return web.Response(status=403)
+    report = profile_capture.stop()
+    if report is None:
+        return web.Response(status=409, text="not running\n")
+    name, text = report
+    return web.Response(text=text, content_type="text/plain", charset="utf-8",
+                        headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+def add_routes(app):
+    # Маршруты работают только при заданном PROFILE_TOKEN
+    app.router.add_post("/debug/profile/start", handle_profile_start)
+    app.router.add_post("/debug/profile/stop", handle_profile_stop)
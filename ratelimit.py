@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше burst про запас."""
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(max(1, burst))
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self):
+        """Сколько секунд ждать до следующего токена (0 — можно сразу)."""
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def try_acquire(self):
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds):
+        """Пауза после 429 от Telegram: до истечения retry_after токены не выдаются."""
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат (с небольшим запасом на всплеск)
+GLOBAL_RATE = float(os.getenv("API_GLOBAL_RATE", "30"))
+GLOBAL_BURST = int(os.getenv("API_GLOBAL_BURST", "30"))
+CHAT_RATE = float(os.getenv("API_CHAT_RATE", "1"))
+CHAT_BURST = int(os.getenv("API_CHAT_BURST", "3"))
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+# Сколько корзин чатов держать в памяти; простаивающая корзина полна и её можно выбросить
+MAX_CHAT_BUCKETS = int(os.getenv("API_MAX_CHAT_BUCKETS", "10000"))
+
+HIGH = 0  # ответы пользователям
+LOW = 1   # уведомления админу
+LANES = (HIGH, LOW)
+
+
+class RateGovernor(BaseRequestMiddleware):
+    """Request-middleware для Bot: глобальная и поштучная по чатам корзины токенов.
+
+    Запросы, упёршиеся в глобальный лимит, ждут в очереди с приоритетами —
+    ответы пользователям идут раньше уведомлений админу. На 429 чат ставится
+    на паузу на retry_after и запрос повторяется.
+    """
+
+    def __init__(self, low_priority_chats=(), global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, max_retries=MAX_RETRIES,
+                 max_chat_buckets=MAX_CHAT_BUCKETS):
+        self.low_priority_chats = set(low_priority_chats)
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._chat_buckets = OrderedDict()
+        self._waiters = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self.waiting = {lane: 0 for lane in LANES}
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            while len(self._chat_buckets) >= self.max_chat_buckets:
+                self._chat_buckets.popitem(last=False)
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_global(self, lane):
+        # Быстрый путь: никто не ждёт и токен есть
+        if not (self.waiting[HIGH] or self.waiting[LOW]) and self.global_bucket.try_acquire():
+            return
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[lane] += 1
+        self._waiters.put_nowait((lane, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        finally:
+            self.waiting[lane] -= 1
+
+    async def _dispatch(self):
+        # Выдаёт глобальные токены ожидающим строго по приоритету
+        while not self._waiters.empty():
+            lane, _, future = self._waiters.get_nowait()
+            if future.done():
+                continue
+            await self.global_bucket.acquire()
+            if not future.done():
+                future.set_result(None)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        self.requests += 1
+        lane = LOW if chat_id in self.low_priority_chats else HIGH
+        bucket = self.chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            if not bucket.try_acquire():
+                self.throttled += 1
+                await bucket.acquire()
+            await self._acquire_global(lane)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                if attempt > self.max_retries:
+                    raise
+                bucket.block(e.retry_after)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "queue_high": self.waiting[HIGH],
+            "queue_low": self.waiting[LOW],
+            "chat_buckets": len(self._chat_buckets),
+        }
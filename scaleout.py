@@ -0,0 +1,161 @@
+"""Режим горизонтального масштабирования: фронт + N процессов-воркеров.
+
+Фронт принимает webhook на общем порту, отсекает повторы и пересылает апдейт
+воркеру user_id % N, так что весь диалог одного пользователя живёт в одном
+процессе. Воркеры — обычный bot.py на 127.0.0.1:WORKER_BASE_PORT+i; сессии,
+баны и конфиг опроса у них общие (SQLite-файл и questions_data.json), но
+каждый воркер поднимает и удаляет только строки своих пользователей.
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+
+import aiohttp
+from aiohttp import web
+
+from ingest import INGEST_QUEUE_SIZE, UpdateDeduplicator, update_user_id
+
+SCALE_WORKERS = int(os.getenv("SCALE_WORKERS", "0"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "10100"))
+# Задан у процесса-воркера: порт, на котором он слушает апдейты от фронта
+WORKER_PORT = os.getenv("WORKER_PORT")
+# Номер воркера: ему принадлежат пользователи с user_id % SCALE_WORKERS == WORKER_INDEX
+WORKER_INDEX = os.getenv("WORKER_INDEX")
+# Пауза перед перезапуском упавшего воркера и перед повтором пересылки
+RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+FORWARD_RETRY_DELAY = float(os.getenv("FORWARD_RETRY_DELAY", "0.5"))
+
+# Лимиты Telegram общие на бота, поэтому делим их между воркерами
+SHARED_RATE_ENV = ("API_GLOBAL_RATE", "LEAD_RATE")
+SHARED_RATE_DEFAULTS = {"API_GLOBAL_RATE": "30", "LEAD_RATE": "1"}
+
+
+def is_worker():
+    return WORKER_PORT is not None
+
+
+def worker_shard():
+    """(воркеров, номер) для процесса-воркера, иначе None — процессу принадлежат все пользователи."""
+    if not is_worker() or WORKER_INDEX is None or SCALE_WORKERS < 2:
+        return None
+    return SCALE_WORKERS, int(WORKER_INDEX)
+
+
+def shard_for(update, workers):
+    return update_user_id(update) % workers
+
+
+def worker_env(index, workers):
+    env = dict(os.environ)
+    env["WORKER_PORT"] = str(WORKER_BASE_PORT + index)
+    env["WORKER_INDEX"] = str(index)
+    for name in SHARED_RATE_ENV:
+        total = float(os.getenv(name, SHARED_RATE_DEFAULTS[name]))
+        env[name] = str(total / workers)
+    return env
+
+
+class ScaleOutFront:
+    def __init__(self, workers, script, base_port=WORKER_BASE_PORT, queue_size=INGEST_QUEUE_SIZE):
+        self.workers = workers
+        self.script = script
+        self.base_port = base_port
+        self.deduplicator = UpdateDeduplicator()
+        per_shard = max(1, queue_size // workers)
+        self._queues = [asyncio.Queue(per_shard) for _ in range(workers)]
+        self._procs = [None] * workers
+        self._tasks = []
+        self._session = None
+        self._closing = False
+        self.forwarded = [0] * workers
+        self.overflowed = 0
+        self.forward_errors = 0
+        self.restarts = 0
+
+    def _spawn(self, index):
+        self._procs[index] = subprocess.Popen(
+            [sys.executable, self.script], env=worker_env(index, self.workers))
+
+    async def _supervise(self, index):
+        # Упавший воркер поднимается заново; его апдейты ждут в очереди шарда
+        while not self._closing:
+            proc = self._procs[index]
+            if proc is None or proc.poll() is not None:
+                if proc is not None:
+                    print(f"Worker {index} exited with {proc.returncode}, restarting")
+                    self.restarts += 1
+                    await asyncio.sleep(RESTART_DELAY)
+                self._spawn(index)
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _forward(self, index):
+        # Один пересыльщик на шард — порядок апдейтов пользователя сохраняется
+        url = f"http://127.0.0.1:{self.base_port + index}/webhook"
+        queue = self._queues[index]
+        while True:
+            update = await queue.get()
+            try:
+                while True:
+                    try:
+                        async with self._session.post(url, json=update) as resp:
+                            if resp.status == 200:
+                                self.forwarded[index] += 1
+                                break
+                    except aiohttp.ClientError:
+                        pass
+                    # Воркер ещё стартует или перегружен — повторяем, не теряя апдейт
+                    self.forward_errors += 1
+                    await asyncio.sleep(FORWARD_RETRY_DELAY)
+            finally:
+                queue.task_done()
+
+    async def handle(self, request):
+        update = await request.json()
+        update_id = update.get("update_id")
+        if not self.deduplicator.add(update_id):
+            return web.Response()
+        try:
+            self._queues[shard_for(update, self.workers)].put_nowait(update)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            self.deduplicator.discard(update_id)
+            return web.Response(status=503)
+        return web.Response()
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._supervise(index)))
+            self._tasks.append(asyncio.create_task(self._forward(index)))
+
+    async def close(self, timeout=30):
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            print("Scale-out front stopped with undelivered updates")
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._session.close()
+        # Воркеры сами дорабатывают свои очереди и сбрасывают хранилище по SIGTERM
+        for proc in self._procs:
+            if proc is not None and proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc in self._procs:
+            if proc is not None:
+                await asyncio.to_thread(proc.wait)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "depth": [q.qsize() for q in self._queues],
+            "forwarded": list(self.forwarded),
+            "overflowed": self.overflowed,
+            "forward_errors": self.forward_errors,
+            "restarts": self.restarts,
+            "dedup_hits": self.deduplicator.hits,
+        }
@@ -0,0 +1,203 @@
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from storage import StorageBackend, row_to_session
+
+# Максимум одновременно хранимых сессий и время простоя (сек), после которого сессия удаляется
+SESSION_MAX_SIZE = int(os.getenv("SESSION_MAX_SIZE", "100000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+
+
+class Session:
+    """Состояние одного пользователя: FSM-состояние, FSM-данные и прогресс опроса."""
+
+    __slots__ = ("user_id", "state", "data", "lang", "answers", "q_idx",
+                 "awaiting_manual_source", "survey", "survey_digest", "touched")
+
+    def __init__(self, user_id, now=0.0):
+        self.user_id = user_id
+        self.state = None
+        self.data = {}
+        self.touched = now
+        self.reset_survey()
+
+    def reset_survey(self):
+        self.lang = None
+        self.answers = {}
+        self.q_idx = 0
+        self.awaiting_manual_source = False
+        # Закреплённая версия опроса; на диск пишется только digest
+        self.survey = None
+        self.survey_digest = None
+
+
+class SessionStore:
+    """LRU-хранилище сессий с ограничением размера и удалением по времени простоя."""
+
+    def __init__(self, max_size=SESSION_MAX_SIZE, ttl=SESSION_TTL, clock=time.monotonic,
+                 backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.backend = backend or StorageBackend()
+        self._sessions = OrderedDict()
+        # user_id, которых нет и в постоянном хранилище: повторный промах не ходит в базу.
+        # Новый пользователь промахивается несколько раз за первый же апдейт (FSM, welcome, reset)
+        self._missing = OrderedDict()
+        self.created = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def attach(self, backend):
+        """Подключает постоянное хранилище и загружает из него свежие сессии."""
+        self.backend = backend
+        self._missing.clear()
+        now_mono, now_wall = self.clock(), time.time()
+        for row in backend.load_sessions(self.max_size, now_wall - self.ttl):
+            session = row_to_session(Session, row, now_mono, now_wall)
+            self._sessions[session.user_id] = session
+        return len(self._sessions)
+
+    def get(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = self._load(user_id)
+            if session is None:
+                return None
+        now = self.clock()
+        if now - session.touched > self.ttl:
+            del self._sessions[user_id]
+            self.backend.delete_session(user_id)
+            self._remember_missing(user_id)
+            self.evicted_ttl += 1
+            return None
+        session.touched = now
+        self._sessions.move_to_end(user_id)
+        # Сессию берут, чтобы изменить — она попадёт в ближайшую пакетную запись
+        self.backend.mark_dirty(session)
+        return session
+
+    def _load(self, user_id):
+        if user_id in self._missing:
+            return None
+        # Вытесненная до сброса на диск сессия новее своей строки в базе — берём её саму
+        pending, session = self.backend.pending_session(user_id)
+        if pending:
+            if session is None:
+                self._remember_missing(user_id)
+                return None
+        else:
+            # Вытесненная по LRU сессия могла остаться в постоянном хранилище
+            row = self.backend.load_session(user_id)
+            if row is None:
+                self._remember_missing(user_id)
+                return None
+            session = row_to_session(Session, row, self.clock(), time.time())
+        self._evict_lru()
+        self._sessions[user_id] = session
+        return session
+
+    def _remember_missing(self, user_id):
+        self._missing[user_id] = None
+        if len(self._missing) > self.max_size:
+            self._missing.popitem(last=False)
+
+    def get_or_create(self, user_id):
+        session = self.get(user_id)
+        if session is None:
+            session = self._create(user_id)
+        return session
+
+    def reset(self, user_id):
+        """Сессия для нового прохождения опроса: прогресс сброшен."""
+        session = self.get_or_create(user_id)
+        session.reset_survey()
+        return session
+
+    def _evict_lru(self):
+        # Из памяти уходит, но в постоянном хранилище остаётся до истечения TTL
+        while len(self._sessions) >= self.max_size:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+
+    def _create(self, user_id):
+        now = self.clock()
+        self.sweep(now)
+        self._evict_lru()
+        session = Session(user_id, now)
+        self._sessions[user_id] = session
+        self._missing.pop(user_id, None)
+        self.backend.mark_dirty(session)
+        self.created += 1
+        return session
+
+    def sweep(self, now=None):
+        """Удаляет простаивающие сессии. Самые старые лежат в начале, поэтому
+        проход останавливается на первой живой."""
+        if now is None:
+            now = self.clock()
+        sessions = self._sessions
+        while sessions:
+            user_id, session = next(iter(sessions.items()))
+            if now - session.touched <= self.ttl:
+                break
+            del sessions[user_id]
+            self.backend.delete_session(user_id)
+            self.evicted_ttl += 1
+
+    def stats(self):
+        return {
+            "active": len(self._sessions),
+            "created": self.created,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "known_missing": len(self._missing),
+        }
+
+
+class SessionStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх SessionStore — состояние и прогресс живут в одной сессии."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            session = self.sessions.get(key.user_id)
+            if session is not None:
+                session.state = None
+            return
+        self.sessions.get_or_create(key.user_id).state = state
+
+    async def get_state(self, key):
+        session = self.sessions.get(key.user_id)
+        return session.state if session is not None else None
+
+    async def set_data(self, key, data):
+        if not data:
+            session = self.sessions.get(key.user_id)
+            if session is not None:
+                session.data = {}
+            return
+        self.sessions.get_or_create(key.user_id).data = data.copy()
+
+    async def get_data(self, key):
+        session = self.sessions.get(key.user_id)
+        return session.data.copy() if session is not None else {}
+
+    async def close(self):
+        pass
+
+
+sessions = SessionStore()
@@ -0,0 +1,163 @@
+"""Быстрый холодный старт.
+
+Импорт aiogram занимает секунды (сборка pydantic-моделей), а до этого порт не
+слушается и Telegram копит апдейты. В режиме FAST_STARTUP=1 bot.py сначала
+поднимает лёгкий aiohttp-сервер: он сразу отвечает Telegram 200 и складывает
+апдейты в буфер, а модуль бота тем временем импортируется в отдельном потоке.
+Когда бот готов, буфер прогоняется через обычный webhook-обработчик, и все
+запросы дальше идут в настоящее приложение.
+
+Здесь же — снимок (marshal) проверенного конфига опроса и карты file_id
+картинок: при неизменных исходных файлах старт обходится без разбора JSON.
+"""
+import asyncio
+import importlib
+import marshal
+import os
+import time
+
+from aiohttp import web
+
+from ingest import INGEST_QUEUE_SIZE
+from scaleout import SCALE_WORKERS, WORKER_PORT, is_worker
+
+STARTUP_SNAPSHOT = os.getenv("STARTUP_SNAPSHOT", "startup_snapshot.bin")
+# Меняется при изменении структуры снимка — старый тогда просто игнорируется
+SNAPSHOT_FORMAT = 1
+
+
+def listen_address():
+    if is_worker():
+        # Webhook ставит фронт, воркер слушает только локальный порт
+        return "127.0.0.1", int(WORKER_PORT)
+    return "0.0.0.0", int(os.getenv("PORT", "10000"))
+
+
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = self._last - self.started
+        parts = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases)
+        print(f"Startup: {parts}, total {total:.3f}s")
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_snapshot(path=STARTUP_SNAPSHOT):
+    try:
+        with open(path, "rb") as f:
+            snapshot = marshal.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("Error loading startup snapshot:", e)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return snapshot
+
+
+def snapshot_part(snapshot, name, source):
+    """Часть снимка, если исходный файл с тех пор не менялся, иначе None."""
+    if snapshot is None:
+        return None
+    part = snapshot.get(name)
+    if part is None or part.get("sig") != file_signature(source):
+        return None
+    return part["value"]
+
+
+def save_snapshot(parts, path=STARTUP_SNAPSHOT):
+    """parts: имя -> (file_signature исходного файла, значение). Блокирующая — звать через asyncio.to_thread.
+
+    Подпись снимает вызывающий — до того, как взял значение: иначе файл,
+    изменённый между чтением и записью снимка, получит чужие данные.
+    """
+    snapshot = {"format": SNAPSHOT_FORMAT}
+    for name, (sig, value) in parts.items():
+        snapshot[name] = {"sig": sig, "value": value}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print("Error saving startup snapshot:", e)
+
+
+class EarlyListener:
+    """Слушает порт, пока импортируется бот. Потом передаёт запросы настоящему приложению."""
+
+    def __init__(self, webhook_path, maxsize=INGEST_QUEUE_SIZE):
+        self.webhook_path = webhook_path
+        self.maxsize = maxsize
+        self.timer = StartupTimer()
+        self.buffer = []
+        self.overflowed = 0
+        self.runner = None
+        self._target = None
+
+    async def handle(self, request):
+        if self._target is not None:
+            match = await self._target.router.resolve(request)
+            return await match.handler(request)
+        if request.method == "POST" and request.path == self.webhook_path:
+            if len(self.buffer) >= self.maxsize:
+                # Telegram повторит апдейт позже
+                self.overflowed += 1
+                return web.Response(status=503)
+            self.buffer.append(await request.json())
+            return web.Response()
+        return web.Response(status=503)
+
+    async def start(self, host, port):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def install(self, app, accept):
+        """Прогоняет накопленные апдейты через accept и переключает запросы на app."""
+        app.freeze()
+        while self.buffer:
+            # Пока дренируем, новые апдейты всё ещё копятся в буфере и идут следом
+            buffered, self.buffer = self.buffer, []
+            for update in buffered:
+                await accept(update)
+        self._target = app
+        return self.overflowed
+
+
+async def _run(early):
+    host, port = listen_address()
+    await early.start(host, port)
+    early.timer.mark("listen")
+    print(f"Listening on {host}:{port}, loading bot")
+    # Импорт в потоке: event loop в это время принимает апдейты
+    bot = await asyncio.to_thread(importlib.import_module, "bot")
+    early.timer.mark("import")
+    await bot.main(early=early)
+
+
+def run(webhook_path="/webhook"):
+    if SCALE_WORKERS > 1 and not is_worker():
+        # Фронт scale-out режима сам ничего не обрабатывает — быстрый старт нужен его воркерам
+        asyncio.run(importlib.import_module("bot").main())
+        return
+    asyncio.run(_run(EarlyListener(webhook_path)))
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# "sqlite" — сессии и баны переживают рестарт, "memory" — всё только в памяти процесса
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+STORAGE_PATH = os.getenv("STORAGE_PATH", "bot_state.db")
+# Как часто (в секундах) сбрасывать накопленные изменения на диск
+FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "1.0"))
+
+
+def session_to_row(session, now_mono, now_wall):
+    # touched хранится по monotonic-часам, на диск пишем настенное время
+    touched = now_wall - (now_mono - session.touched)
+    return (
+        session.user_id,
+        session.state,
+        json.dumps(session.data, ensure_ascii=False) if session.data else None,
+        session.lang,
+        json.dumps(session.answers, ensure_ascii=False),
+        session.q_idx,
+        int(session.awaiting_manual_source),
+        session.survey_digest,
+        touched,
+    )
+
+
+def row_to_session(session_cls, row, now_mono, now_wall):
+    user_id, state, data, lang, answers, q_idx, awaiting, survey_digest, touched = row
+    session = session_cls(user_id, now_mono - (now_wall - touched))
+    session.state = state
+    session.data = json.loads(data) if data else {}
+    session.lang = lang
+    session.answers = json.loads(answers) if answers else {}
+    session.q_idx = q_idx
+    session.awaiting_manual_source = bool(awaiting)
+    # Сам Survey подставит бот при следующем ответе, если версия ещё в памяти
+    session.survey_digest = survey_digest
+    return session
+
+
+class StorageBackend:
+    """Хранилище сессий и банов. Базовый класс ничего не сохраняет (режим "memory")."""
+
+    # (воркеров, номер) в scale-out режиме: процесс читает и удаляет только строки своих пользователей
+    shard = None
+
+    def load_sessions(self, limit, min_touched):
+        return []
+
+    def load_session(self, user_id):
+        return None
+
+    def mark_dirty(self, session):
+        pass
+
+    def pending_session(self, user_id):
+        """Несброшенная запись: (True, Session или None — удалена) или (False, None)."""
+        return False, None
+
+    def delete_session(self, user_id):
+        pass
+
+    def load_bans(self, owned_only=True):
+        return []
+
+    def add_ban(self, user_id):
+        pass
+
+    def remove_ban(self, user_id):
+        pass
+
+    def pending_bans(self):
+        return {}
+
+    async def start(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite в режиме WAL с отложенной пакетной записью.
+
+    Хендлеры только помечают сессию изменённой; раз в FLUSH_INTERVAL секунд все
+    изменения пишутся одной транзакцией в отдельном потоке, поэтому на каждый
+    ответ не приходится ни одного fsync.
+    """
+
+    def __init__(self, path=STORAGE_PATH, flush_interval=FLUSH_INTERVAL, ttl=None, shard=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.shard = shard
+        self._lock = threading.Lock()
+        # timeout — ожидание блокировки, если в тот же файл пишут другие процессы (режим scale-out)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id INTEGER PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                lang TEXT,
+                answers TEXT,
+                q_idx INTEGER NOT NULL DEFAULT 0,
+                awaiting_manual_source INTEGER NOT NULL DEFAULT 0,
+                survey_digest TEXT,
+                touched REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched);
+            CREATE TABLE IF NOT EXISTS bans (user_id INTEGER PRIMARY KEY);
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "survey_digest" not in columns:
+            # База от предыдущей версии бота
+            try:
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN survey_digest TEXT")
+            except sqlite3.OperationalError:
+                # Колонку уже добавил соседний воркер
+                pass
+        # Чтения с event loop идут через своё соединение: в WAL они не ждут пакетную запись
+        # и не берут self._lock, который поток записи держит всю транзакцию.
+        # Соединение привязано к потоку event loop (check_same_thread по умолчанию)
+        self._reader = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._reader.execute("PRAGMA query_only=1")
+        # user_id -> Session (сохранить) или None (удалить)
+        self._pending = {}
+        # Пачка, которую сейчас пишет поток: в базе её ещё нет
+        self._inflight = {}
+        # user_id -> True (бан) или False (разбан), побеждает последнее действие
+        self._pending_bans = {}
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def owns(self, user_id):
+        return self.shard is None or user_id % self.shard[0] == self.shard[1]
+
+    def _shard_sql(self):
+        """Условие «строка своего шарда» для WHERE и его параметры."""
+        if self.shard is None:
+            return "", ()
+        n, i = self.shard
+        # В SQLite % берёт знак делимого — приводим к остатку, как в Python
+        return " AND ((user_id % ?) + ?) % ? = ?", (n, n, n, i)
+
+    def load_sessions(self, limit, min_touched):
+        cond, params = self._shard_sql()
+        rows = self._reader.execute(
+            "SELECT user_id, state, data, lang, answers, q_idx, awaiting_manual_source, survey_digest, touched "
+            "FROM sessions WHERE touched >= ?" + cond + " ORDER BY touched DESC LIMIT ?",
+            (min_touched, *params, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def load_session(self, user_id):
+        return self._reader.execute(
+            "SELECT user_id, state, data, lang, answers, q_idx, awaiting_manual_source, survey_digest, touched "
+            "FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+
+    def mark_dirty(self, session):
+        self._pending[session.user_id] = session
+
+    def pending_session(self, user_id):
+        # Сначала более свежие изменения, потом пишущаяся пачка
+        for pending in (self._pending, self._inflight):
+            if user_id in pending:
+                return True, pending[user_id]
+        return False, None
+
+    def delete_session(self, user_id):
+        # Чужую строку не трогаем: сессией владеет другой воркер
+        if self.owns(user_id):
+            self._pending[user_id] = None
+
+    def load_bans(self, owned_only=True):
+        cond, params = self._shard_sql() if owned_only else ("", ())
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM bans WHERE 1" + cond, params)]
+
+    def add_ban(self, user_id):
+        self._pending_bans[user_id] = True
+
+    def remove_ban(self, user_id):
+        self._pending_bans[user_id] = False
+
+    def pending_bans(self):
+        return dict(self._pending_bans)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Error flushing storage:", e)
+
+    async def flush(self):
+        if not self._pending and not self._pending_bans:
+            return
+        pending, self._pending = self._pending, {}
+        bans, self._pending_bans = self._pending_bans, {}
+        # Сериализуем в потоке event loop, чтобы не гоняться с хендлерами за сессиями
+        now_mono, now_wall = time.monotonic(), time.time()
+        upserts = []
+        deletes = []
+        for user_id, session in pending.items():
+            if session is None:
+                deletes.append((user_id,))
+            else:
+                upserts.append(session_to_row(session, now_mono, now_wall))
+        expired_before = now_wall - self.ttl if self.ttl is not None else None
+        self._inflight = pending
+        try:
+            await asyncio.to_thread(self._write, upserts, deletes, bans, expired_before)
+        except Exception:
+            # Возвращаем несохранённое в очередь, более свежие изменения не трогаем
+            for user_id, session in pending.items():
+                self._pending.setdefault(user_id, session)
+            for user_id, banned in bans.items():
+                self._pending_bans.setdefault(user_id, banned)
+            raise
+        finally:
+            self._inflight = {}
+
+    def _write(self, upserts, deletes, bans, expired_before):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                if upserts:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO sessions "
+                        "(user_id, state, data, lang, answers, q_idx, awaiting_manual_source, "
+                        "survey_digest, touched) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+                if deletes:
+                    conn.executemany("DELETE FROM sessions WHERE user_id = ?", deletes)
+                if bans:
+                    conn.executemany("INSERT OR IGNORE INTO bans (user_id) VALUES (?)",
+                                     [(uid,) for uid, banned in bans.items() if banned])
+                    conn.executemany("DELETE FROM bans WHERE user_id = ?",
+                                     [(uid,) for uid, banned in bans.items() if not banned])
+                if expired_before is not None:
+                    cond, params = self._shard_sql()
+                    conn.execute("DELETE FROM sessions WHERE touched < ?" + cond, (expired_before, *params))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.rows_written += len(upserts) + len(deletes) + len(bans)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self._reader.close()
+        with self._lock:
+            self._conn.close()
+
+
+def make_backend(ttl=None, shard=None):
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(STORAGE_PATH, ttl=ttl, shard=shard)
+    if STORAGE_BACKEND == "memory":
+        return StorageBackend()
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {STORAGE_BACKEND}")
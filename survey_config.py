@@ -0,0 +1,344 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from keyboards import REMOVE_KEYBOARD, choices_keyboard
+from validators import compile_validator, infer_spec
+
+QUESTIONS_FILE = "questions_data.json"
+
+# Как часто (в секундах) проверять mtime файла с вопросами
+CHECK_INTERVAL = float(os.getenv("SURVEY_CHECK_INTERVAL", "1.0"))
+
+EMPTY_DATA = {"ru": [], "en": []}
+
+
+def freeze(value):
+    """Рекурсивно превращает dict/list в неизменяемые mappingproxy/tuple."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Обратная операция к freeze — изменяемая копия для админ-панели."""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+class Question:
+    """Вопрос опроса с заранее скомпилированными валидатором, клавиатурами и переходами."""
+
+    __slots__ = ("idx", "text", "type", "choices", "depends_on", "dep_key", "allowed",
+                 "spec", "validate", "other_min_len", "is_source", "edges", "default_next",
+                 "keyboard", "error_keyboard")
+
+    def __init__(self, idx, raw):
+        self.idx = idx
+        self.text = raw["question"]
+        self.type = raw.get("type", "text")
+        self.choices = raw.get("choices", ())
+        self.depends_on = raw.get("depends_on")
+        if self.depends_on:
+            self.dep_key = int(self.depends_on["question_idx"])
+            self.allowed = frozenset(v.strip().lower() for v in self.depends_on["values"])
+        else:
+            self.dep_key = None
+            self.allowed = frozenset()
+        self.spec = raw.get("validator") or freeze(infer_spec(raw))
+        self.validate = compile_validator(self.spec, self.choices)
+        self.is_source = self.spec["type"] == "other_free_text"
+        self.other_min_len = int(self.spec.get("min_len", 5)) if self.is_source else 0
+        if self.type == "choice":
+            self.keyboard = choices_keyboard(self.choices, special_layout=self.is_source)
+            # При ошибке показываем варианты без пробелов по краям — ровно те, что примет валидатор
+            self.error_keyboard = choices_keyboard(
+                [ch.strip() for ch in self.choices], special_layout=self.is_source)
+        else:
+            self.keyboard = REMOVE_KEYBOARD
+            self.error_keyboard = None
+        self.edges = {}
+        self.default_next = idx + 1
+
+    def is_active(self, answers):
+        if self.dep_key is None:
+            return True
+        return answers.get(f"q{self.dep_key+1}", "").strip().lower() in self.allowed
+
+
+def check_graph(questions):
+    """Проверяет ссылки depends_on: индексы в пределах опроса и только на более ранние вопросы.
+
+    Раз каждая ссылка ведёт назад, циклов быть не может — обходить цепочки не нужно.
+    """
+    n = len(questions)
+    for q in questions:
+        if q.dep_key is None:
+            continue
+        if not 0 <= q.dep_key < n:
+            raise ValueError(f"Вопрос {q.idx+1}: depends_on ссылается на несуществующий вопрос {q.dep_key+1}")
+        if q.dep_key == q.idx:
+            raise ValueError(f"Вопрос {q.idx+1}: depends_on ссылается на самого себя")
+        if q.dep_key > q.idx:
+            raise ValueError(f"Вопрос {q.idx+1}: depends_on ссылается на более поздний вопрос {q.dep_key+1}")
+
+
+def _walk(questions, idx, key):
+    j = idx + 1
+    while j < len(questions):
+        qj = questions[j]
+        if qj.dep_key == idx and key not in qj.allowed:
+            j += 1
+            continue
+        break
+    return j
+
+
+def link_graph(questions):
+    """Заранее считает переходы: для каждого вопроса — следующий индекс по ответу."""
+    check_graph(questions)
+    for q in questions:
+        keys = set()
+        for qj in questions[q.idx + 1:]:
+            if qj.dep_key == q.idx:
+                keys |= qj.allowed
+        q.default_next = _walk(questions, q.idx, None)
+        q.edges = {key: _walk(questions, q.idx, key) for key in keys}
+    return questions
+
+
+class Survey:
+    """Неизменяемый снимок конфигурации опроса."""
+
+    # __weakref__ — чтобы SurveyCache мог держать старые версии, не продлевая им жизнь
+    __slots__ = ("version", "mtime", "data", "compiled", "digest", "__weakref__")
+
+    def __init__(self, version, mtime, data):
+        self.version = version
+        self.mtime = mtime
+        self.data = freeze(data)
+        # version — счётчик перезагрузок в процессе, digest одинаков у всех процессов и после рестарта
+        canonical = json.dumps(thaw(self.data), ensure_ascii=False, sort_keys=True)
+        self.digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+        self.compiled = {}
+        for lang in ("ru", "en"):
+            self.compiled[lang] = link_graph(tuple(
+                Question(i, q) for i, q in enumerate(self.data.get(lang, ()))))
+
+    def questions(self, lang):
+        return self.compiled.get(lang, ())
+
+    def next_index(self, lang, idx, answer, answers):
+        questions = self.compiled[lang]
+        q = questions[idx]
+        nxt = q.edges.get(answer.strip().lower(), q.default_next)
+        # Редкий случай: следующий вопрос зависит от более раннего ответа, а не от текущего
+        while nxt < len(questions) and not questions[nxt].is_active(answers):
+            nxt += 1
+        return nxt
+
+
+def validate_data(data):
+    """Проверяет конфиг опроса целиком (структура, валидаторы, depends_on). Бросает ValueError."""
+    if not isinstance(data, Mapping):
+        raise ValueError("Конфиг опроса должен быть объектом")
+    for lang in ("ru", "en"):
+        questions = data.get(lang)
+        if not isinstance(questions, (list, tuple)) or not questions:
+            raise ValueError(f"{lang}: нет списка вопросов")
+        for i, q in enumerate(questions):
+            where = f"{lang}, вопрос {i+1}"
+            if not isinstance(q, Mapping):
+                raise ValueError(f"{where}: ожидался объект")
+            if not isinstance(q.get("question"), str) or not q["question"].strip():
+                raise ValueError(f"{where}: пустой текст вопроса")
+            if q.get("type", "text") not in ("text", "choice"):
+                raise ValueError(f"{where}: неизвестный тип {q.get('type')!r}")
+            choices = q.get("choices", ())
+            if not isinstance(choices, (list, tuple)) or not all(isinstance(c, str) and c.strip() for c in choices):
+                raise ValueError(f"{where}: варианты ответа должны быть непустыми строками")
+            if q.get("type") == "choice" and not choices:
+                raise ValueError(f"{where}: у вопроса с выбором нет вариантов")
+            dep = q.get("depends_on")
+            if dep is not None and not (
+                    isinstance(dep, Mapping) and isinstance(dep.get("question_idx"), int)
+                    and not isinstance(dep["question_idx"], bool)
+                    and isinstance(dep.get("values"), (list, tuple)) and dep["values"]):
+                raise ValueError(f"{where}: depends_on должен содержать question_idx и values")
+            if dep is not None and not all(isinstance(v, str) and v.strip() for v in dep["values"]):
+                raise ValueError(f"{where}: значения depends_on должны быть непустыми строками")
+            validator = q.get("validator")
+            if validator is not None and not (isinstance(validator, Mapping) and "type" in validator):
+                raise ValueError(f"{where}: у валидатора нет поля type")
+            if validator is not None and validator["type"] in ("choice", "other_free_text") and not choices:
+                # Такой вопрос нечем ответить — пользователь застрял бы на нём
+                raise ValueError(f"{where}: валидатору {validator['type']} нужны варианты ответа")
+    if not isinstance(data.get("contact_link", ""), str):
+        raise ValueError("contact_link должен быть строкой")
+    phrase = data.get("final_phrase", "")
+    if not isinstance(phrase, str) and not (
+            isinstance(phrase, Mapping) and all(isinstance(v, str) for v in phrase.values())):
+        raise ValueError("final_phrase должна быть строкой или объектом {язык: строка}")
+    try:
+        # Компиляция ловит неизвестные валидаторы и ошибки в графе depends_on
+        Survey(0, None, data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Опрос не компилируется: {e}") from None
+
+
+def dump_questions(data):
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_atomic(path, payload):
+    """Пишет payload во временный файл рядом и подменяет path через rename.
+
+    Читатель видит либо старый файл, либо новый целиком. Возвращает True,
+    если sha256 записанного файла совпал с payload. Блокирующая — звать
+    из потока, не из event loop.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    # Фиксируем сам rename в каталоге
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.digest() == hashlib.sha256(payload).digest()
+
+
+class SurveyCache:
+    """Текущая версия опроса плюс все прежние, на которые ещё ссылаются сессии.
+
+    Сессия держит свой Survey до конца прохождения; _versions хранит слабые
+    ссылки по digest, так что старая версия живёт ровно до тех пор, пока её
+    не отпустит последняя сессия, а перезагрузка никого не останавливает.
+    """
+
+    def __init__(self, path=QUESTIONS_FILE, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._survey = None
+        self._version = 0
+        # mtime файла, который читали последним — даже если он оказался битым
+        self._seen_mtime = None
+        # True, пока вместо конфига отдаётся пустая заглушка (рабочей версии ещё не было)
+        self.placeholder = False
+        self._versions = weakref.WeakValueDictionary()
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.pin_misses = 0
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self):
+        """Содержимое файла или None, если его не прочитать."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print("Error loading questions:", e)
+            return None
+
+    def _publish(self, data, mtime):
+        # Битый файл перечитываем только после следующего изменения
+        self._seen_mtime = mtime
+        survey = None
+        if data is not None:
+            try:
+                survey = Survey(self._version + 1, mtime, data)
+            except Exception as e:
+                print("Error compiling questions:", e)
+        if survey is None:
+            # Нечитаемый или некомпилируемый файл не заменяет последнюю рабочую версию
+            if self._survey is not None:
+                return self._survey
+            survey = Survey(self._version + 1, mtime, EMPTY_DATA)
+            self.placeholder = True
+        else:
+            self.placeholder = False
+        self._version = survey.version
+        self._survey = survey
+        self._versions[survey.digest] = survey
+        self.reloads += 1
+        return survey
+
+    def get(self, force=False):
+        """Текущая версия; force=True сверяет mtime файла сразу, не дожидаясь check_interval."""
+        survey = self._survey
+        now = time.monotonic()
+        if not force and survey is not None and now - self._checked_at < self.check_interval:
+            return survey
+        with self._lock:
+            self._checked_at = now
+            mtime = self._mtime()
+            if self._survey is None or mtime != self._seen_mtime:
+                self._publish(self._read(), mtime)
+            return self._survey
+
+    def publish(self, data):
+        """Вызывается после успешной записи файла — новый снимок сразу виден всем."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            return self._publish(data, self._mtime())
+
+    def version(self, digest):
+        """Версия опроса по digest, пока она в памяти, иначе None (например, после рестарта)."""
+        if digest is None:
+            return None
+        current = self.get()
+        if current.digest == digest:
+            return current
+        survey = self._versions.get(digest)
+        if survey is None:
+            self.pin_misses += 1
+        return survey
+
+    def stats(self):
+        return {
+            "versions": len(self._versions),
+            "current": self._survey.version if self._survey is not None else 0,
+            "pin_misses": self.pin_misses,
+        }
+
+
+survey_cache = SurveyCache()
+
+
+def get_survey():
+    return survey_cache.get()
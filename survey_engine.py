@@ -0,0 +1,197 @@
+"""Движок опроса без aiogram и ввода-вывода.
+
+step(survey, progress, text) принимает текущий прогресс пользователя и его
+сообщение и возвращает новый прогресс и список действий: что отправить,
+какую картинку показать, какие события учесть. Хендлеры в bot.py только
+переводят сессию в Progress и исполняют действия, поэтому тысячи сессий
+можно прогонять в цикле или в пуле процессов — для бенчмарков и повторного
+проигрывания записанного трафика (см. bench/engine_bench.py).
+"""
+from collections import namedtuple
+from collections.abc import Mapping
+
+from keyboards import LANG_KEYBOARD, REMOVE_KEYBOARD, START_KEYBOARDS
+from validators import BAN, OK, OTHER
+
+# Этапы диалога; DONE и BANNED — опрос окончен, FSM-состояние сбрасывается
+LANG = "lang"
+WAIT_START = "wait_start"
+QUESTION = "question"
+OTHER_TEXT = "other_text"
+DONE = "done"
+BANNED = "banned"
+
+# answers не меняется на месте: новый ответ — новый словарь
+Progress = namedtuple("Progress", "stage lang q_idx answers")
+
+# Действия. keyboard=None — клавиатуру не трогаем
+Send = namedtuple("Send", "text keyboard", defaults=(None,))
+Photo = namedtuple("Photo", "name")
+# started, question, invalid, banned, completed; idx — номер вопроса, если есть
+Event = namedtuple("Event", "kind idx", defaults=(None,))
+Lead = namedtuple("Lead", "answers contact_link final_phrase")
+
+WELCOME_TEXT = {
+    "ru": """Благодарим за интерес к нашему проекту. Сейчас вы пройдёте короткий опрос — это поможет нам лучше понять ваши цели и подобрать для вас максимально подходящий путь обучения.
+
+FCK Academy (от англ. Finance Crypto Knowledge) — современная образовательная платформа с более чем 4-летним опытом в сфере криптовалют и цифровых инвестиций. Мы обучаем не теории, а реальной торговле в DeFi секторе: каждый студент работает с живым рынком под руководством профессионалов.
+
+За это время FCK Academy прошли более 1600 студентов. Из них 82 % начали получать доход в первую неделю, а 68 % — сформировали устойчивый инвестиционный портфель за 14 дней. Средняя прибыль по сделкам под кураторским сопровождением составляет от 13 % до 21 % в неделю, в зависимости от стратегии и уровня вовлечённости.
+
+Над результатами студентов работают более 12 опытных кураторов, доступных 24/7. Обучение строится на четырёх ключевых принципах:
+
+— Постоянная практика на реальном рынке  
+— Поддержка на каждом этапе  
+— Возможность зарабатывать из любой точки мира""",
+    "en": "Thank you for your interest in our project. Now you will take a short survey — this will help us better understand your goals and find the most suitable learning path for you."
+}
+
+ERROR_MSG = {
+    "ru": "Дай ответ более корректно и открыто",
+    "en": "Please answer more clearly and openly"
+}
+
+AGE_BLOCK_MSG = {
+    "ru": "Извините, наш сервис только для лиц старше 18 лет. Доступ закрыт.",
+    "en": "Sorry, our service is only for people over 18 years old. Access denied."
+}
+
+
+LANG_CHOICES = {"русский": "ru", "рус": "ru", "ru": "ru", "english": "en", "en": "en"}
+START_WORDS = {"ru": "старт", "en": "start"}
+
+
+def render_final_phrase(phrase: str, contact_link: str) -> str:
+    link = contact_link.strip()
+    if not link.startswith("@"):
+        link = f"@{link}"
+    return phrase.replace("{contact_link}", link)
+
+
+def final_phrase(survey, lang):
+    """(contact_link, финальная фраза на языке пользователя без подстановки ссылки)."""
+    data = survey.data
+    contact_link = data.get("contact_link", "@manager")
+    phrase = data.get("final_phrase",
+        {
+            "ru": f"Спасибо! Напишите нашему менеджеру {contact_link} для дальнейших инструкций.",
+            "en": f"Thank you! Please message our manager {contact_link} for further instructions."
+        }
+    )
+    return contact_link, phrase[lang] if isinstance(phrase, Mapping) else phrase
+
+
+def start():
+    """Начало диалога (/start): выбор языка."""
+    return Progress(LANG, None, 0, {}), [Send("Выберите язык / Select language:", LANG_KEYBOARD)]
+
+
+def ask(survey, progress):
+    """Показывает текущий вопрос или, если вопросы кончились, завершает опрос."""
+    lang = progress.lang or "ru"
+    questions = survey.questions(lang)
+    idx = progress.q_idx
+    # Переходы с учётом depends_on посчитаны при загрузке опроса, здесь idx уже актуальный
+    if idx < len(questions):
+        q = questions[idx]
+        # Клавиатура собрана вместе с версией опроса
+        return progress._replace(stage=QUESTION), [
+            Event("question", idx), Photo(f"{idx+1}.jpg"), Send(q.text, q.keyboard)]
+    contact_link, phrase = final_phrase(survey, lang)
+    return progress._replace(stage=DONE), [
+        Send(render_final_phrase(phrase, contact_link), REMOVE_KEYBOARD),
+        Event("completed"),
+        Lead(progress.answers, contact_link, phrase),
+    ]
+
+
+def _answered(survey, progress, text):
+    lang = progress.lang or "ru"
+    idx = progress.q_idx
+    answers = dict(progress.answers)
+    answers[f"q{idx+1}"] = text
+    return ask(survey, progress._replace(
+        answers=answers, q_idx=survey.next_index(lang, idx, text, answers)))
+
+
+def _choose_lang(survey, progress, text):
+    lang = LANG_CHOICES.get(text.strip().lower())
+    if lang is None:
+        return progress, [Send("Пожалуйста, выберите язык / Please select a language:", LANG_KEYBOARD)]
+    return progress._replace(stage=WAIT_START, lang=lang), [
+        Photo("logo.jpg"),
+        Send(WELCOME_TEXT[lang]),
+        Send("Начнем опрос! / Let's start the survey!", START_KEYBOARDS[lang]),
+    ]
+
+
+def _start_survey(survey, progress, text):
+    lang = progress.lang or "ru"
+    if text.strip().lower() != START_WORDS[lang]:
+        msg = "Нажмите кнопку 'СТАРТ'!" if lang == "ru" else "Press the 'START' button!"
+        return progress, [Send(msg, START_KEYBOARDS[lang])]
+    progress, actions = ask(survey, progress._replace(q_idx=0))
+    return progress, [Event("started")] + actions
+
+
+def _answer(survey, progress, text):
+    lang = progress.lang or "ru"
+    idx = progress.q_idx
+    questions = survey.questions(lang)
+    if idx >= len(questions):
+        return ask(survey, progress)
+    q = questions[idx]
+    # Валидатор скомпилирован при загрузке опроса из поля "validator"
+    result = q.validate(text.strip())
+    if result == BAN:
+        return progress._replace(stage=BANNED), [Event("banned"), Send(AGE_BLOCK_MSG[lang])]
+    if result == OTHER:
+        msg = f"Пожалуйста, напишите свой вариант (не менее {q.other_min_len} символов):" if lang == "ru" else f"Please write your own option (at least {q.other_min_len} characters):"
+        return progress._replace(stage=OTHER_TEXT), [Send(msg, REMOVE_KEYBOARD)]
+    if result != OK:
+        return progress, [Event("invalid", idx), Send(ERROR_MSG[lang], q.error_keyboard)]
+    return _answered(survey, progress, text)
+
+
+def _other_text(survey, progress, text):
+    lang = progress.lang or "ru"
+    idx = progress.q_idx
+    questions = survey.questions(lang)
+    if idx >= len(questions):
+        return ask(survey, progress)
+    if len(text.strip()) < questions[idx].other_min_len:
+        return progress, [Event("invalid", idx), Send(ERROR_MSG[lang])]
+    return _answered(survey, progress, text)
+
+
+STEPS = {
+    LANG: _choose_lang,
+    WAIT_START: _start_survey,
+    QUESTION: _answer,
+    OTHER_TEXT: _other_text,
+}
+
+
+def _not_text(survey, progress):
+    """Голосовое, стикер, фото вместо ответа на вопрос — ошибка ввода, вопрос остаётся тем же."""
+    lang = progress.lang or "ru"
+    idx = progress.q_idx
+    questions = survey.questions(lang)
+    keyboard = questions[idx].error_keyboard if progress.stage == QUESTION and idx < len(questions) else None
+    return progress, [Event("invalid", idx), Send(ERROR_MSG[lang], keyboard)]
+
+
+def step(survey, progress, text):
+    """Один шаг диалога: (новый Progress, список действий). Завершённый опрос ответов не принимает.
+
+    text=None — сообщение без текста.
+    """
+    handler = STEPS.get(progress.stage)
+    if handler is None:
+        return progress, []
+    if text is None:
+        if progress.stage in (QUESTION, OTHER_TEXT):
+            return _not_text(survey, progress)
+        # На выборе языка и кнопке START — то же, что любой неподходящий текст
+        text = ""
+    return handler(survey, progress, text)
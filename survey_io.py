@@ -0,0 +1,180 @@
+"""Массовый импорт и экспорт опроса: XLSX-таблица <-> questions_data.json.
+
+Лист «Вопросы»: по строке на вопрос (язык, номер, текст, тип, варианты и
+значения depends_on — по одному в строке ячейки, валидатор — JSON). Лист
+«Настройки»: contact_link и финальные фразы. Импорт проверяет конфиг целиком
+и записывает его одним атомарным файлом — бот получает одну новую версию.
+
+    python survey_io.py export survey.xlsx
+    python survey_io.py import survey.xlsx
+"""
+import argparse
+import io
+import json
+import os
+
+from survey_config import QUESTIONS_FILE, dump_questions, validate_data, write_atomic
+
+QUESTIONS_SHEET = "Вопросы"
+SETTINGS_SHEET = "Настройки"
+QUESTION_COLUMNS = ["Язык", "№", "Вопрос", "Тип", "Варианты", "Зависит от №", "Значения", "Валидатор"]
+LANGS = ("ru", "en")
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("Для работы с XLSX нужен пакет openpyxl") from None
+    return openpyxl
+
+
+def _lines(value):
+    if value is None:
+        return []
+    return [line.strip() for line in str(value).splitlines() if line.strip()]
+
+
+def survey_to_xlsx(data):
+    """Конфиг опроса -> содержимое XLSX-файла (bytes)."""
+    openpyxl = _openpyxl()
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = QUESTIONS_SHEET
+    ws.append(QUESTION_COLUMNS)
+    for lang in LANGS:
+        for i, q in enumerate(data.get(lang, ())):
+            dep = q.get("depends_on")
+            validator = q.get("validator")
+            ws.append([
+                lang,
+                i + 1,
+                q["question"],
+                q.get("type", "text"),
+                "\n".join(q.get("choices", ())) or None,
+                dep["question_idx"] + 1 if dep else None,
+                "\n".join(dep["values"]) if dep else None,
+                json.dumps(validator, ensure_ascii=False) if validator else None,
+            ])
+    settings = wb.create_sheet(SETTINGS_SHEET)
+    settings.append(["contact_link", data.get("contact_link", "")])
+    phrase = data.get("final_phrase")
+    if isinstance(phrase, str):
+        settings.append(["final_phrase", phrase])
+    elif phrase:
+        for lang, text in phrase.items():
+            settings.append([f"final_phrase_{lang}", text])
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def survey_from_xlsx(content):
+    """Содержимое XLSX-файла -> конфиг опроса (без проверки, см. validate_data)."""
+    openpyxl = _openpyxl()
+    wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    if QUESTIONS_SHEET not in wb.sheetnames:
+        raise ValueError(f"В файле нет листа «{QUESTIONS_SHEET}»")
+    data = {lang: [] for lang in LANGS}
+    rows = wb[QUESTIONS_SHEET].iter_rows(values_only=True)
+    header = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+    missing = [c for c in QUESTION_COLUMNS if c not in header]
+    if missing:
+        raise ValueError("Нет колонок: " + ", ".join(missing))
+    col = {name: header.index(name) for name in QUESTION_COLUMNS}
+    numbered = {lang: [] for lang in LANGS}
+    for n, row in enumerate(rows, start=2):
+        def cell(name):
+            return row[col[name]] if col[name] < len(row) else None
+        if all(v is None or str(v).strip() == "" for v in row):
+            continue
+        lang = str(cell("Язык") or "").strip().lower()
+        if lang not in data:
+            raise ValueError(f"Строка {n}: неизвестный язык {lang!r}")
+        try:
+            number = int(cell("№"))
+        except (TypeError, ValueError):
+            raise ValueError(f"Строка {n}: в колонке № должно быть число") from None
+        q = {"question": str(cell("Вопрос") or "").strip(),
+             "type": str(cell("Тип") or "text").strip().lower()}
+        choices = _lines(cell("Варианты"))
+        if choices:
+            q["choices"] = choices
+        dep = cell("Зависит от №")
+        if dep is not None and str(dep).strip():
+            try:
+                q["depends_on"] = {"question_idx": int(dep) - 1, "values": _lines(cell("Значения"))}
+            except (TypeError, ValueError):
+                raise ValueError(f"Строка {n}: в колонке «Зависит от №» должно быть число") from None
+        validator = cell("Валидатор")
+        if validator is not None and str(validator).strip():
+            try:
+                q["validator"] = json.loads(str(validator))
+            except ValueError:
+                raise ValueError(f"Строка {n}: валидатор должен быть JSON") from None
+        numbered[lang].append((number, n, q))
+    for lang, items in numbered.items():
+        # Порядок вопросов — по колонке №, номера должны идти подряд с 1
+        items.sort(key=lambda item: item[0])
+        for expected, (number, n, q) in enumerate(items, start=1):
+            if number != expected:
+                raise ValueError(f"Строка {n}: {lang} — ожидался вопрос № {expected}, а не {number}")
+            data[lang].append(q)
+    if SETTINGS_SHEET in wb.sheetnames:
+        phrases = {}
+        for row in wb[SETTINGS_SHEET].iter_rows(values_only=True):
+            if not row or row[0] is None:
+                continue
+            key = str(row[0]).strip()
+            value = "" if len(row) < 2 or row[1] is None else str(row[1])
+            if key == "contact_link":
+                data["contact_link"] = value.strip()
+            elif key == "final_phrase":
+                data["final_phrase"] = value
+            elif key.startswith("final_phrase_"):
+                phrases[key[len("final_phrase_"):]] = value
+        if phrases:
+            data["final_phrase"] = phrases
+    wb.close()
+    return data
+
+
+def load_document(filename, content):
+    """Разбирает присланный файл (.xlsx или .json) и проверяет конфиг. Бросает ValueError."""
+    name = filename.lower()
+    if name.endswith(".xlsx"):
+        data = survey_from_xlsx(content)
+    elif name.endswith(".json"):
+        try:
+            data = json.loads(content.decode("utf-8-sig"))
+        except ValueError as e:
+            raise ValueError(f"Некорректный JSON: {e}") from None
+    else:
+        raise ValueError("Поддерживаются файлы .xlsx и .json")
+    validate_data(data)
+    return data
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("action", choices=("export", "import"))
+    p.add_argument("path", help="XLSX-файл (при импорте можно и .json)")
+    p.add_argument("--config", default=QUESTIONS_FILE, help="файл конфига опроса")
+    args = p.parse_args(argv)
+    if args.action == "export":
+        with open(args.config, encoding="utf-8") as f:
+            data = json.load(f)
+        with open(args.path, "wb") as f:
+            f.write(survey_to_xlsx(data))
+        print(f"Exported survey to {args.path}")
+        return
+    with open(args.path, "rb") as f:
+        data = load_document(os.path.basename(args.path), f.read())
+    # Запущенный бот подхватит файл по mtime как одну новую версию
+    if not write_atomic(args.config, dump_questions(data)):
+        raise SystemExit("Checksum mismatch after writing " + args.config)
+    print(f"Imported {len(data['ru'])} ru / {len(data['en'])} en questions into {args.config}")
+
+
+if __name__ == "__main__":
+    main()
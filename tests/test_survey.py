@@ -0,0 +1,279 @@
+"""Тесты движка опроса, графа depends_on, валидаторов, дедупликации и импорта/экспорта.
+
+    python -m pytest -q
+"""
+import copy
+import json
+import os
+
+import pytest
+
+import survey_engine
+from ingest import UpdateDeduplicator
+from survey_config import QUESTIONS_FILE, Question, Survey, check_graph, link_graph, validate_data
+from survey_engine import BANNED, DONE, OTHER_TEXT, QUESTION, Event, Lead, Progress, Send
+from validators import BAN, ERROR, OK, OTHER, compile_validator, is_text_with_letters_ratio, letters_ratio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ответы на вопросы 1-4 из questions_data.json
+RU_ANSWERS = ["Иван Иванов", "30", "Россия"]
+EN_ANSWERS = ["John Smith", "30", "Germany"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    with open(os.path.join(ROOT, QUESTIONS_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def survey(data):
+    return Survey(1, None, data)
+
+
+def at_question(lang, idx, answers=None):
+    return Progress(QUESTION, lang, idx, answers or {})
+
+
+def run(survey, progress, *texts):
+    actions = []
+    for text in texts:
+        progress, actions = survey_engine.step(survey, progress, text)
+    return progress, actions
+
+
+def kinds(actions):
+    return [a.kind for a in actions if isinstance(a, Event)]
+
+
+# survey_engine.step
+
+@pytest.mark.parametrize("lang, answers, no", [("ru", RU_ANSWERS, "Нет"), ("en", EN_ANSWERS, "No")])
+def test_no_skips_question_5(survey, lang, answers, no):
+    progress, _ = run(survey, at_question(lang, 0), *answers, no)
+    assert progress.stage == QUESTION
+    assert progress.q_idx == 5
+    assert "q5" not in progress.answers
+    assert progress.answers["q4"] == no
+
+
+@pytest.mark.parametrize("lang, answers, yes", [("ru", RU_ANSWERS, "Да"), ("en", EN_ANSWERS, "Yes")])
+def test_yes_asks_question_5(survey, lang, answers, yes):
+    progress, _ = run(survey, at_question(lang, 0), *answers, yes)
+    assert progress.q_idx == 4
+
+
+@pytest.mark.parametrize("lang, other", [("ru", "Другое"), ("en", "Other")])
+def test_other_free_text(survey, lang, other):
+    progress, actions = survey_engine.step(survey, at_question(lang, 5), other)
+    assert progress.stage == OTHER_TEXT
+    assert progress.q_idx == 5
+    assert "5" in actions[-1].text
+
+    # Короче min_len — ошибка, ждём свой вариант дальше
+    short, actions = survey_engine.step(survey, progress, "  Дру  ")
+    assert short == progress
+    assert kinds(actions) == ["invalid"]
+
+    progress, _ = survey_engine.step(survey, progress, "Друзья посоветовали")
+    assert progress.stage == QUESTION
+    assert progress.q_idx == 6
+    assert progress.answers["q6"] == "Друзья посоветовали"
+
+
+@pytest.mark.parametrize("lang", ["ru", "en"])
+def test_under_18_is_banned(survey, lang):
+    progress, actions = survey_engine.step(survey, at_question(lang, 1), "17")
+    assert progress.stage == BANNED
+    assert kinds(actions) == ["banned"]
+    assert actions[-1].text == survey_engine.AGE_BLOCK_MSG[lang]
+    # После бана ответы не принимаются
+    assert survey_engine.step(survey, progress, "30") == (progress, [])
+
+
+def test_age_must_be_a_number(survey):
+    progress = at_question("ru", 1)
+    assert survey_engine.step(survey, progress, "тридцать") == (
+        progress, [Event("invalid", 1), Send(survey_engine.ERROR_MSG["ru"], None)])
+
+
+@pytest.mark.parametrize("stage", [QUESTION, OTHER_TEXT])
+def test_non_text_input_repeats_question(survey, stage):
+    progress = Progress(stage, "en", 3, {})
+    new, actions = survey_engine.step(survey, progress, None)
+    assert new == progress
+    assert kinds(actions) == ["invalid"]
+    keyboard = actions[-1].keyboard
+    if stage == QUESTION:
+        assert keyboard is survey.questions("en")[3].error_keyboard
+    else:
+        assert keyboard is None
+
+
+def test_non_text_input_on_language_choice(survey):
+    progress, _ = survey_engine.start()
+    new, actions = survey_engine.step(survey, progress, None)
+    assert new == progress
+    assert actions[0].keyboard is survey_engine.LANG_KEYBOARD
+
+
+@pytest.mark.parametrize("stage", [QUESTION, OTHER_TEXT])
+def test_out_of_range_q_idx_finishes_survey(survey, stage):
+    idx = len(survey.questions("ru")) + 3
+    progress, actions = survey_engine.step(survey, Progress(stage, "ru", idx, {"q1": "x"}), "ответ")
+    assert progress.stage == DONE
+    assert "completed" in kinds(actions)
+    assert isinstance(actions[-1], Lead)
+    assert actions[-1].answers == {"q1": "x"}
+
+
+def test_non_text_with_out_of_range_q_idx(survey):
+    progress = at_question("ru", len(survey.questions("ru")))
+    new, actions = survey_engine.step(survey, progress, None)
+    assert new == progress
+    assert actions[-1].keyboard is None
+
+
+def test_full_survey(survey):
+    progress, _ = survey_engine.start()
+    progress, actions = run(
+        survey, progress, "Русский", "СТАРТ", *RU_ANSWERS, "Да", "Фьючерсы и спот",
+        "Telegram", "Хочу 1000 долларов в месяц")
+    assert progress.stage == DONE
+    assert sorted(progress.answers) == ["q1", "q2", "q3", "q4", "q5", "q6", "q7"]
+    assert "{contact_link}" not in actions[0].text
+
+
+# link_graph / check_graph
+
+def questions(*deps):
+    """Вопросы-заглушки; deps[i] — question_idx, от которого зависит i-й вопрос, или None."""
+    return tuple(
+        Question(i, {"question": f"Q{i+1}", "type": "text",
+                     **({"depends_on": {"question_idx": dep, "values": ["да"]}} if dep is not None else {})})
+        for i, dep in enumerate(deps))
+
+
+@pytest.mark.parametrize("deps, message", [
+    ((None, 5), "несуществующий вопрос 6"),
+    ((None, -1), "несуществующий вопрос 0"),
+    ((None, 1), "на самого себя"),
+    ((2, None, None), "более поздний вопрос 3"),
+])
+def test_check_graph_errors(deps, message):
+    with pytest.raises(ValueError, match=message):
+        check_graph(questions(*deps))
+
+
+def test_link_graph_edges():
+    linked = link_graph(questions(None, 0, 0, None))
+    assert linked[0].edges == {"да": 1}
+    assert linked[0].default_next == 3
+
+
+def test_survey_rejects_bad_graph(data):
+    broken = copy.deepcopy(data)
+    broken["ru"][4]["depends_on"]["question_idx"] = 10
+    with pytest.raises(ValueError, match="Вопрос 5"):
+        Survey(1, None, broken)
+    with pytest.raises(ValueError, match="Опрос не компилируется"):
+        validate_data(broken)
+
+
+@pytest.mark.parametrize("patch, message", [
+    (lambda d: d["en"][4]["depends_on"].update(values=["Yes", 1]), r"en, вопрос 5: значения depends_on"),
+    (lambda d: d["ru"][3].update(type="text", choices=[]), r"ru, вопрос 4: валидатору choice нужны варианты"),
+    (lambda d: d["ru"][1].update(validator={"type": "nope"}), "Неизвестный валидатор"),
+    (lambda d: d.update(contact_link=5), "contact_link"),
+])
+def test_validate_data_errors(data, patch, message):
+    broken = copy.deepcopy(data)
+    patch(broken)
+    with pytest.raises(ValueError, match=message):
+        validate_data(broken)
+
+
+def test_validate_data_accepts_shipped_config(data):
+    validate_data(data)
+
+
+# validators
+
+def test_age_min():
+    validate = compile_validator({"type": "age_min", "min": 18})
+    assert [validate(t) for t in ("18", "17", "abc", "")] == [OK, BAN, ERROR, ERROR]
+
+
+def test_letter_ratio():
+    assert letters_ratio("") == 0.0
+    assert letters_ratio("   ") == 0.0
+    assert letters_ratio("Иван Иванов") == 1.0
+    assert letters_ratio("ab12") == 0.5
+    assert not is_text_with_letters_ratio("   ")
+    assert is_text_with_letters_ratio("ab12", 0.5)
+    assert not is_text_with_letters_ratio("ab123", 0.5)
+    validate = compile_validator({"type": "letter_ratio", "min_ratio": 0.7})
+    assert validate("John Smith") == OK
+    assert validate("12345") == ERROR
+
+
+def test_min_len():
+    validate = compile_validator({"type": "min_len", "min_len": 3})
+    assert [validate(t) for t in ("abc", "ab")] == [OK, ERROR]
+
+
+def test_choice():
+    validate = compile_validator({"type": "choice"}, [" Да ", "Нет"])
+    assert [validate(t) for t in ("Да", "Нет", "да", "Может")] == [OK, OK, ERROR, ERROR]
+
+
+def test_other_free_text():
+    validate = compile_validator({"type": "other_free_text", "other": ["Другое"]}, ["Telegram", "Другое"])
+    assert [validate(t) for t in ("Telegram", "другое", "Instagram")] == [OK, OTHER, ERROR]
+
+
+def test_unknown_validator():
+    with pytest.raises(ValueError):
+        compile_validator({"type": "nope"})
+
+
+# UpdateDeduplicator
+
+def test_dedup_wraparound():
+    dedup = UpdateDeduplicator(window=3)
+    assert [dedup.add(i) for i in (1, 2, 3)] == [True, True, True]
+    assert not dedup.add(2)
+    # 4 вытесняет самый старый — 1, остальные ещё в окне
+    assert dedup.add(4)
+    assert not dedup.add(3)
+    assert dedup.add(1)
+    assert dedup.add(2)
+    assert dedup.stats() == {"hits": 2, "misses": 6, "size": 3}
+
+
+def test_dedup_discard_and_none():
+    dedup = UpdateDeduplicator(window=2)
+    assert dedup.add(None) and dedup.add(None)
+    assert dedup.add(7)
+    dedup.discard(7)
+    assert dedup.add(7)
+
+
+# survey_io
+
+def test_xlsx_round_trip(data):
+    pytest.importorskip("openpyxl")
+    from survey_io import load_document, survey_to_xlsx
+
+    assert load_document("questions.xlsx", survey_to_xlsx(data)) == data
+
+
+def test_xlsx_round_trip_per_language_final_phrase(data):
+    pytest.importorskip("openpyxl")
+    from survey_io import load_document, survey_to_xlsx
+
+    changed = copy.deepcopy(data)
+    changed["final_phrase"] = {"ru": "Пишите {contact_link}", "en": "Write to {contact_link}"}
+    del changed["en"][4]["depends_on"]
+    assert load_document("questions.xlsx", survey_to_xlsx(changed)) == changed
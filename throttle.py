@@ -0,0 +1,191 @@
+"""Ограничение частоты входящих сообщений от одного пользователя.
+
+Скользящее окно считается по двум соседним фиксированным окнам (текущее и
+предыдущее с линейным весом) — на пользователя несколько чисел, без списка
+отметок времени. Записи лежат в OrderedDict по времени последнего апдейта и
+вытесняются с головы, как только простаивают дольше двух окон или словарь
+вырос больше THROTTLE_MAX_USERS.
+
+Политики при превышении лимита:
+  drop     — лишние апдейты отбрасываются молча;
+  coalesce — из пачки лишних обрабатывается только последний, когда окно освободится
+             (он заново встаёт в очередь пользователя через resubmit — порядок не нарушается);
+  mute     — пользователь замолкает на THROTTLE_MUTE секунд, одно предупреждение;
+  off      — без ограничений.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+
+THROTTLE_POLICY = os.getenv("THROTTLE_POLICY", "coalesce")
+# Не больше THROTTLE_LIMIT апдейтов за THROTTLE_WINDOW секунд
+THROTTLE_LIMIT = int(os.getenv("THROTTLE_LIMIT", "10"))
+THROTTLE_WINDOW = float(os.getenv("THROTTLE_WINDOW", "10"))
+THROTTLE_MUTE = float(os.getenv("THROTTLE_MUTE", "60"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "100000"))
+
+POLICIES = ("drop", "coalesce", "mute", "off")
+
+
+class _Window:
+    __slots__ = ("start", "prev", "cur", "touched", "muted_until", "pending", "released")
+
+    def __init__(self, now):
+        self.start = now
+        self.prev = 0
+        self.cur = 0
+        self.touched = now
+        self.muted_until = 0.0
+        # coalesce: последний отложенный апдейт и update_id уже выпущенного обратно в очередь
+        self.pending = None
+        self.released = None
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Outer-middleware на update, стоит до FSM: отброшенный апдейт не трогает хранилище."""
+
+    def __init__(self, policy=THROTTLE_POLICY, limit=THROTTLE_LIMIT, window=THROTTLE_WINDOW,
+                 mute=THROTTLE_MUTE, max_users=THROTTLE_MAX_USERS, notice=None, exempt=(),
+                 resubmit=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная THROTTLE_POLICY: {policy}")
+        self.policy = policy
+        self.limit = limit
+        self.window = window
+        self.mute = mute
+        self.max_users = max_users
+        self.notice = notice
+        self.exempt = frozenset(exempt)
+        # resubmit(update, user_id) -> bool: ставит апдейт в очередь пользователя (UpdateQueue.submit)
+        self.resubmit = resubmit
+        self._windows = OrderedDict()
+        self._tasks = set()
+        self.passed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.delayed = 0
+        self.mutes = 0
+        self.evicted = 0
+
+    def _roll(self, w, now):
+        elapsed = now - w.start
+        if elapsed >= self.window:
+            n = int(elapsed // self.window)
+            w.prev = w.cur if n == 1 else 0
+            w.cur = 0
+            w.start += n * self.window
+
+    def _estimate(self, w, now):
+        return w.prev * (1 - (now - w.start) / self.window) + w.cur
+
+    def _wait(self, w, now):
+        """Через сколько секунд окно примет ещё один апдейт."""
+        room = self.limit - 1
+        if w.cur <= room:
+            if not w.prev:
+                return 0.0
+            # Ждём, пока вклад предыдущего окна не упадёт достаточно
+            e = self.window * (1 - (room - w.cur) / w.prev)
+            return max(0.0, w.start + e - now)
+        e = self.window * (1 - room / w.cur) if w.cur else 0.0
+        return max(0.0, w.start + self.window + e - now)
+
+    def _window_for(self, user_id, now):
+        windows = self._windows
+        w = windows.get(user_id)
+        if w is None:
+            w = windows[user_id] = _Window(now)
+        else:
+            windows.move_to_end(user_id)
+        w.touched = now
+        self._roll(w, now)
+        # С головы — самые давно молчавшие
+        stale = now - 2 * self.window
+        while windows:
+            uid, oldest = next(iter(windows.items()))
+            if oldest is w:
+                break
+            idle = (oldest.touched < stale and oldest.muted_until <= now
+                    and oldest.pending is None and oldest.released is None)
+            if not idle and len(windows) <= self.max_users:
+                break
+            del windows[uid]
+            self.evicted += 1
+        return w
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if self.policy == "off" or user is None or user.id in self.exempt:
+            return await handler(event, data)
+        now = time.monotonic()
+        w = self._window_for(user.id, now)
+        if w.released is not None and w.released == event.update_id:
+            # Отложенный апдейт вернулся из очереди — в окне он уже учтён
+            w.released = None
+            return await handler(event, data)
+        if w.muted_until > now:
+            self.dropped += 1
+            return None
+        if w.pending is not None:
+            # Уже ждёт отложенный апдейт — заменяем его более свежим
+            w.pending = event
+            self.coalesced += 1
+            return None
+        if self._estimate(w, now) + 1 <= self.limit:
+            w.cur += 1
+            self.passed += 1
+            return await handler(event, data)
+        if self.policy == "drop":
+            self.dropped += 1
+            return None
+        if self.policy == "mute":
+            w.muted_until = now + self.mute
+            self.mutes += 1
+            self.dropped += 1
+            if self.notice and event.message is not None:
+                await event.message.answer(self.notice)
+            return None
+        if self.resubmit is None:
+            # Без очереди отложенный апдейт обогнал бы следующие апдейты пользователя
+            self.dropped += 1
+            return None
+        w.pending = event
+        self.delayed += 1
+        task = asyncio.create_task(self._release(user.id, w, self._wait(w, now)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return None
+
+    async def _release(self, user_id, w, delay):
+        await asyncio.sleep(delay)
+        event, w.pending = w.pending, None
+        now = time.monotonic()
+        self._roll(w, now)
+        # Сам апдейт обработает задача пользователя в UpdateQueue — по порядку с остальными его апдейтами
+        if not self.resubmit(event, user_id):
+            self.dropped += 1
+            return
+        w.cur += 1
+        w.touched = now
+        w.released = event.update_id
+        self.passed += 1
+
+    async def close(self):
+        # Отложенные апдейты — и так лишние, при остановке их не ждём
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "users": len(self._windows),
+            "passed": self.passed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "delayed": self.delayed,
+            "mutes": self.mutes,
+            "evicted": self.evicted,
+        }
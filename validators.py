@@ -0,0 +1,122 @@
+"""Декларативные валидаторы ответов.
+
+Каждый вопрос в questions_data.json может содержать поле "validator":
+
+    {"type": "age_min", "min": 18}
+    {"type": "letter_ratio", "min_ratio": 0.7}
+    {"type": "min_len", "min_len": 5}
+    {"type": "choice"}
+    {"type": "other_free_text", "other": ["Другое", "Other"], "min_len": 5}
+
+При загрузке опроса описание компилируется в функцию text -> результат,
+поэтому на каждый ответ приходится один вызов без разбора текста вопроса.
+"""
+
+OK = "ok"
+ERROR = "error"
+BAN = "ban"
+OTHER = "other"
+
+LETTERS = frozenset(
+    [chr(c) for c in range(ord("a"), ord("z") + 1)]
+    + [chr(c) for c in range(ord("A"), ord("Z") + 1)]
+    + [chr(c) for c in range(ord("а"), ord("я") + 1)]
+    + [chr(c) for c in range(ord("А"), ord("Я") + 1)]
+    + ["ё", "Ё"]
+)
+
+DEFAULT_OTHER = ("другое", "other")
+
+
+def letters_ratio(text):
+    """Доля букв среди непробельных символов за один проход по строке."""
+    length = letters = 0
+    for ch in text:
+        if ch != " ":
+            length += 1
+            if ch in LETTERS:
+                letters += 1
+    return letters / length if length else 0.0
+
+
+def is_text_with_letters_ratio(text, min_ratio=0.7):
+    # Пустая строка и одни пробелы дают 0.0 — такой ответ не проходит
+    return letters_ratio(text) >= min_ratio
+
+
+def _age_min(spec, choices):
+    min_age = int(spec.get("min", 18))
+
+    def validate(text):
+        if not text.isdigit():
+            return ERROR
+        if int(text) < min_age:
+            return BAN
+        return OK
+    return validate
+
+
+def _letter_ratio(spec, choices):
+    min_ratio = float(spec.get("min_ratio", 0.7))
+
+    def validate(text):
+        return OK if is_text_with_letters_ratio(text, min_ratio) else ERROR
+    return validate
+
+
+def _min_len(spec, choices):
+    min_len = int(spec.get("min_len", 1))
+
+    def validate(text):
+        return OK if len(text) >= min_len else ERROR
+    return validate
+
+
+def _choice(spec, choices):
+    valid = frozenset(ch.strip() for ch in choices)
+
+    def validate(text):
+        return OK if text in valid else ERROR
+    return validate
+
+
+def _other_free_text(spec, choices):
+    other = frozenset(v.strip().lower() for v in spec.get("other", DEFAULT_OTHER))
+    valid = frozenset(ch.strip() for ch in choices)
+
+    def validate(text):
+        if text.lower() in other:
+            return OTHER
+        return OK if text in valid else ERROR
+    return validate
+
+
+VALIDATORS = {
+    "age_min": _age_min,
+    "letter_ratio": _letter_ratio,
+    "min_len": _min_len,
+    "choice": _choice,
+    "other_free_text": _other_free_text,
+}
+
+
+def infer_spec(q):
+    """Описание валидатора для старых конфигов без поля "validator"."""
+    text = q.get("question", "").lower()
+    if "сколько вам лет" in text or "how old are you" in text:
+        return {"type": "age_min", "min": 18}
+    if "какой доход вы хотите получать" in text or "what income would you like to receive" in text:
+        return {"type": "letter_ratio", "min_ratio": 0.5}
+    if q.get("type") == "choice":
+        if "узнали про компанию" in text or "how did you hear about" in text:
+            return {"type": "other_free_text", "min_len": 5}
+        return {"type": "choice"}
+    return {"type": "letter_ratio", "min_ratio": 0.7}
+
+
+def compile_validator(spec, choices=()):
+    try:
+        factory = VALIDATORS[spec["type"]]
+    except KeyError:
+        raise ValueError(f"Неизвестный валидатор: {spec!r}")
+    return factory(spec, choices)